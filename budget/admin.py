@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django import forms
 from .models import Account, Category, CategoryGroup, Transaction, Payee, PayeeMatch, BudgetAssignment, EmailSource, EmailRule
+from .search import search_transactions
 
 # --- INLINES ---
 class PayeeMatchInline(admin.TabularInline):
@@ -63,6 +64,12 @@ class TransactionAdmin(admin.ModelAdmin):
     list_display = ('date', 'display_payee_admin', 'amount', 'category', 'account')
     list_filter = ('account', 'category', 'date', 'payee')
     search_fields = ('raw_payee', 'payee__name', 'memo')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Texto completo + trigramas indexados en vez de icontains sobre toda la tabla
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        return search_transactions(queryset, search_term), False
     
     def display_payee_admin(self, obj):
         return obj.payee.name if obj.payee else f"(Raw) {obj.raw_payee}"
@@ -0,0 +1,123 @@
+"""
+Saldos de cuentas a una fecha y su evolución (patrimonio neto).
+
+Para una fecha puntual parte del último cierre mensual guardado
+(AccountBalanceSnapshot) y suma sólo los movimientos posteriores a ese cierre.
+Para una serie completa usa una suma acumulada (window) en una sola consulta.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.db.models import Q, F, Sum, Case, When, Value, CharField, DateField, Window
+from django.db.models.functions import Trunc, Cast
+
+from .ledger import month_of, next_month_start
+from .models import Account, Transaction, AccountBalanceSnapshot
+
+ASSET_TYPES = [Account.Type.CHECKING, Account.Type.SAVINGS, Account.Type.CASH, Account.Type.ASSET]
+DEBT_TYPES = [Account.Type.CREDIT_CARD, Account.Type.LOAN]
+GRANULARITY_STEPS = {
+    'day': relativedelta(days=1),
+    'week': relativedelta(weeks=1),
+    'month': relativedelta(months=1),
+    'quarter': relativedelta(months=3),
+}
+
+
+def balances_at(on_date, account_ids=None):
+    """Saldo de cada cuenta al final del día on_date -> {account_id: saldo} (2 consultas)."""
+    snapshots = AccountBalanceSnapshot.objects.filter(month__lt=month_of(on_date))
+    transactions = Transaction.objects.filter(date__lte=on_date)
+    if account_ids is not None:
+        snapshots = snapshots.filter(account_id__in=account_ids)
+        transactions = transactions.filter(account_id__in=account_ids)
+
+    # Último cierre de cada cuenta anterior al mes de on_date
+    latest = list(
+        snapshots.order_by('account_id', '-month').distinct('account_id').values_list('account_id', 'month', 'balance')
+    )
+
+    balances = {}
+    # Cuentas sin cierre: todo su historial. Con cierre: sólo lo posterior
+    pending = ~Q(account_id__in=[account_id for account_id, _, _ in latest])
+    for account_id, month, balance in latest:
+        balances[account_id] = balance
+        pending |= Q(account_id=account_id, date__gte=next_month_start(month))
+
+    for row in transactions.filter(pending).values('account_id').annotate(total=Sum('amount')):
+        balances[row['account_id']] = balances.get(row['account_id'], Decimal(0)) + row['total']
+    return balances
+
+
+def balance_at(account_id, on_date):
+    return balances_at(on_date, [account_id]).get(account_id, Decimal(0))
+
+
+def period_start(value, granularity):
+    """Inicio del período (igual que date_trunc de Postgres: semanas parten el lunes)."""
+    if granularity == 'week':
+        return value - timedelta(days=value.weekday())
+    if granularity == 'month':
+        return value.replace(day=1)
+    if granularity == 'quarter':
+        return value.replace(month=(value.month - 1) // 3 * 3 + 1, day=1)
+    return value
+
+
+def period_count(start, end, granularity):
+    """Cantidad de períodos entre start y end, sin armar la lista (para validar rangos)."""
+    first = period_start(start, granularity)
+    if end < first:
+        return 0
+    step = GRANULARITY_STEPS[granularity]
+    if step.months:
+        months = (end.year - first.year) * 12 + end.month - first.month
+        return months // step.months + 1
+    return (end - first).days // step.days + 1
+
+
+def period_starts(start, end, granularity):
+    current, step = period_start(start, granularity), GRANULARITY_STEPS[granularity]
+    periods = []
+    while current <= end:
+        periods.append(current)
+        current += step
+    return periods
+
+
+def net_worth_series(start, end, granularity='month'):
+    """
+    Activos, pasivos y neto al cierre de cada período entre start y end (1 consulta).
+    Los movimientos anteriores a start caen en el primer período, así la suma
+    acumulada por clase (activo/pasivo) ya parte del saldo inicial.
+    Retorna [(inicio_periodo, activos, pasivos)].
+    """
+    periods = period_starts(start, end, granularity)
+    rows = Transaction.objects.filter(
+        date__lte=end,
+        account__account_type__in=ASSET_TYPES + DEBT_TYPES
+    ).annotate(
+        period=Case(
+            When(date__lt=periods[0], then=Value(periods[0])),
+            # date_trunc devuelve timestamp: volver a date para comparar con los períodos
+            default=Cast(Trunc('date', granularity), DateField()),
+            output_field=DateField()
+        ),
+        kind=Case(
+            When(account__account_type__in=ASSET_TYPES, then=Value('assets')),
+            default=Value('debts'),
+            output_field=CharField()
+        ),
+        running=Window(Sum('amount'), partition_by=[F('kind')], order_by=F('period').asc())
+    ).values('period', 'kind', 'running').order_by().distinct()
+
+    totals = {(r['period'], r['kind']): r['running'] for r in rows}
+
+    # Períodos sin movimientos arrastran el acumulado anterior
+    series, carried = [], {'assets': Decimal(0), 'debts': Decimal(0)}
+    for period in periods:
+        for kind in carried:
+            carried[kind] = totals.get((period, kind), carried[kind])
+        series.append((period, carried['assets'], carried['debts']))
+    return series
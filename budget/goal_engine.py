@@ -0,0 +1,175 @@
+"""
+Motor de metas (goals) de las categorías.
+
+Evalúa todas las categorías para uno o varios meses de una sola pasada con
+NumPy: las entradas son matrices (categorías x meses) de asignado y disponible.
+No toca la base de datos, así que sirve igual para el resumen mensual, el
+rango de meses, los reportes y el auto-asignar.
+"""
+from dataclasses import dataclass
+from datetime import date
+
+import numpy as np
+
+NONE, MONTHLY, TARGET_BALANCE, TARGET_DATE = 0, 1, 2, 3
+GOAL_CODES = {
+    'NONE': NONE,
+    'MONTHLY': MONTHLY,
+    'TARGET_BALANCE': TARGET_BALANCE,
+    'TARGET_DATE': TARGET_DATE,
+}
+NO_MONTH = -1
+# Más allá de este horizonte la proyección no es útil (y no cabe en un date)
+MAX_PROJECTION_MONTHS = 100 * 12
+
+
+def month_index(value):
+    """Mes como entero (año*12 + mes) para restar fechas en forma vectorizada."""
+    return value.year * 12 + value.month - 1
+
+
+def month_from_index(idx):
+    return date(int(idx) // 12, int(idx) % 12 + 1, 1)
+
+
+def fmt(val):
+    return "{:,.0f}".format(val).replace(",", ".")
+
+
+@dataclass
+class GoalEvaluation:
+    """Resultados por celda (categoría, mes). Todas las matrices tienen forma (n, m)."""
+    kind: np.ndarray
+    required: np.ndarray
+    is_met: np.ndarray
+    percentage: np.ndarray
+    suggested: np.ndarray
+    reached: np.ndarray
+    projected_month: np.ndarray
+
+
+def _percentage(values, goal):
+    # int(x / goal * 100) trunca hacia cero; lo hacemos con enteros para no perder precisión
+    safe_goal = np.where(goal > 0, goal, 1)
+    raw = np.sign(values) * ((np.abs(values) * 100) // safe_goal)
+    return np.where(goal > 0, np.clip(raw, 0, 100), 0)
+
+
+def evaluate_goals(goal_types, goal_amounts, goal_target_dates, assigned, available, months):
+    """
+    goal_types/goal_amounts/goal_target_dates: una entrada por categoría.
+    assigned/available: matrices (categorías x meses) con montos enteros.
+    months: lista de fechas (día 1) de cada columna.
+    """
+    n = len(goal_types)
+    kind = np.array([GOAL_CODES.get(t, NONE) for t in goal_types], dtype=np.int64).reshape(n, 1)
+    goal = np.array([int(a) for a in goal_amounts], dtype=np.int64).reshape(n, 1)
+    target_idx = np.array(
+        [month_index(d) if d else NO_MONTH for d in goal_target_dates], dtype=np.int64
+    ).reshape(n, 1)
+    current_idx = np.array([month_index(m) for m in months], dtype=np.int64).reshape(1, -1)
+
+    assigned = np.asarray(assigned, dtype=np.int64).reshape(n, -1)
+    available = np.asarray(available, dtype=np.int64).reshape(n, -1)
+    zeros = np.zeros(assigned.shape)
+
+    # MONTHLY: asignar X monto cada mes
+    monthly_required = np.maximum(0, goal - assigned)
+    monthly_met = assigned >= goal
+
+    # TARGET_BALANCE: que el disponible sea al menos X
+    balance_required = np.maximum(0, goal - available)
+    balance_met = available >= goal
+
+    # TARGET_DATE: cuota mensual para llegar a X en la fecha (meses restantes incluyendo el actual)
+    has_date = (kind == TARGET_DATE) & (target_idx != NO_MONTH)
+    reached = available >= goal
+    months_remaining = np.maximum(1, target_idx - current_idx + 1)
+    missing_at_start = np.maximum(0, goal - (available - assigned))
+    suggested = missing_at_start / months_remaining
+    # assigned >= suggested - 1 (margen por decimales), comparado en enteros para ser exacto
+    on_track = assigned * months_remaining >= missing_at_start - months_remaining
+    # Una sola división sobre un numerador entero: mismo redondeo que con Decimal
+    date_required = np.where(reached, 0, np.maximum(0, (missing_at_start - assigned * months_remaining) / months_remaining))
+
+    is_monthly = kind == MONTHLY
+    is_balance = kind == TARGET_BALANCE
+
+    required = np.select([is_monthly, is_balance, has_date], [monthly_required, balance_required, date_required], zeros)
+    is_met = np.select([is_monthly, is_balance, has_date], [monthly_met, balance_met, reached | on_track], False)
+    percentage = np.select(
+        [is_monthly, is_balance, has_date],
+        [_percentage(assigned, goal), _percentage(available, goal), np.where(reached, 100, _percentage(available, goal))],
+        0
+    )
+
+    # Mes proyectado en que se completa la meta si se mantiene lo asignado este mes
+    remaining = goal - available
+    safe_assigned = np.where(assigned > 0, assigned, 1)
+    months_needed = -(-remaining // safe_assigned)
+    reachable = (assigned > 0) & (months_needed <= MAX_PROJECTION_MONTHS)
+    projected = np.where(remaining <= 0, current_idx, np.where(reachable, current_idx + months_needed, NO_MONTH))
+    projected = np.where(is_balance | has_date, projected, NO_MONTH)
+
+    return GoalEvaluation(
+        kind=np.broadcast_to(np.where(has_date | (kind != TARGET_DATE), kind, NONE), assigned.shape),
+        required=required,
+        is_met=is_met,
+        percentage=percentage,
+        suggested=np.broadcast_to(suggested, assigned.shape),
+        reached=np.broadcast_to(reached, assigned.shape),
+        projected_month=projected,
+    )
+
+
+def _message(kind, is_met, reached, required, suggested):
+    if kind == MONTHLY:
+        return "Meta mensual cumplida" if is_met else f"Faltan ${fmt(required)}"
+    if kind == TARGET_BALANCE:
+        return "Saldo objetivo alcanzado" if is_met else f"Falta juntar ${fmt(required)}"
+    if kind == TARGET_DATE:
+        if reached:
+            return "¡Meta lograda! 🎉"
+        return "Vas bien este mes 👍" if is_met else f"Aporta ${fmt(suggested)} este mes"
+    return ""
+
+
+def _as_number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def goal_status_grid(categories, assigned, available, months):
+    """
+    Evalúa las metas y arma el dict "goal" que espera el frontend.
+    Retorna una lista (por categoría) de listas (por mes).
+    """
+    if not categories:
+        return []
+
+    result = evaluate_goals(
+        [c.goal_type for c in categories],
+        [c.goal_amount for c in categories],
+        [c.goal_target_date for c in categories],
+        assigned, available, months
+    )
+
+    grid = []
+    for i, cat in enumerate(categories):
+        row = []
+        for j in range(len(months)):
+            kind = result.kind[i, j]
+            is_met = bool(result.is_met[i, j])
+            required = _as_number(result.required[i, j])
+            projected = result.projected_month[i, j]
+            row.append({
+                "type": cat.goal_type,
+                "target": cat.goal_amount,
+                "required": required,
+                "is_met": is_met,
+                "percentage": int(result.percentage[i, j]),
+                "message": _message(kind, is_met, bool(result.reached[i, j]), required, result.suggested[i, j]),
+                "projected_month": month_from_index(projected).strftime('%Y-%m-%d') if projected != NO_MONTH else None
+            })
+        grid.append(row)
+    return grid
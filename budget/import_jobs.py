@@ -0,0 +1,190 @@
+"""
+Importaciones de cartolas en segundo plano.
+
+La vista sólo guarda el archivo y crea un ImportJob; el servicio scheduler
+corre un pool de threads que toma los jobs pendientes y los procesa con
+process_import, actualizando los contadores después de cada bloque.
+
+Threads y no procesos: el trabajo pesado es pandas (que suelta el GIL en el
+parser) y la base de datos. Jobs de cuentas distintas corren en paralelo; los
+de una misma cuenta van de a uno y en orden de llegada, porque el dedupe de un
+archivo depende de lo que insertó el anterior.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .import_service import process_import
+from .models import ImportJob
+from .upload_cache import previous_job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_POLL_SECONDS = 2
+# claimed_by de los jobs que toma el pool (los que reencola al reiniciar)
+POOL_WORKER = 'pool'
+# Llave del pg_advisory_xact_lock que serializa claim_import_jobs
+CLAIM_LOCK_KEY = 7301
+
+
+def workers_setting():
+    return getattr(settings, 'IMPORT_WORKERS', DEFAULT_WORKERS)
+
+
+def poll_seconds_setting():
+    return getattr(settings, 'IMPORT_POLL_SECONDS', DEFAULT_POLL_SECONDS)
+
+
+def create_import_job(account, upload, mapping, claimed_by=''):
+    """
+    Deja en cola la importación de un archivo ya guardado (ImportUpload).
+    claimed_by: el job nace RUNNING porque lo procesa quien lo crea (ej: 'import_files'), no el pool.
+    """
+    status = ImportJob.Status.RUNNING if claimed_by else ImportJob.Status.PENDING
+    return ImportJob.objects.create(
+        account=account, upload=upload, file=upload.file.name, filename=upload.filename, mapping=mapping,
+        status=status, claimed_by=claimed_by, started_at=timezone.now() if claimed_by else None
+    )
+
+
+def enqueue_import(account, upload, mapping, claimed_by=''):
+    """
+    (job, nuevo): el job del archivo con ese mapeo en la cuenta. Si ya se importó (o está
+    en cola) se devuelve ese mismo job en vez de procesarlo de nuevo.
+    """
+    job = previous_job(upload, account, mapping)
+    if job:
+        return job, False
+    return create_import_job(account, upload, mapping, claimed_by), True
+
+
+def claim_import_jobs(limit):
+    """
+    Marca como RUNNING hasta `limit` jobs pendientes, el más antiguo de cada cuenta
+    que no tenga otro corriendo.
+
+    Los claims van de a uno (advisory lock de la transacción): quien entra después
+    ve los RUNNING que confirmó el anterior, así dos dispatchers nunca toman dos
+    jobs de la misma cuenta ni se saltan el más antiguo de una.
+    """
+    if limit <= 0:
+        return []
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [CLAIM_LOCK_KEY])
+        busy = set(ImportJob.objects.filter(status=ImportJob.Status.RUNNING).values_list('account_id', flat=True))
+        pending = ImportJob.objects.filter(
+            status=ImportJob.Status.PENDING
+        ).exclude(account_id__in=busy).order_by('created_at', 'id')
+
+        claimed, accounts = [], set()
+        # La cola es corta: se recorre completa para no saltarse cuentas con pocos jobs
+        for job in pending:
+            if job.account_id in accounts:
+                continue
+            accounts.add(job.account_id)
+            claimed.append(job)
+            if len(claimed) == limit:
+                break
+
+        ImportJob.objects.filter(pk__in=[job.pk for job in claimed]).update(
+            status=ImportJob.Status.RUNNING, claimed_by=POOL_WORKER, started_at=timezone.now()
+        )
+    return [job.pk for job in claimed]
+
+
+def run_import_job(job_id):
+    """Procesa un job ya tomado. Cualquier excepción queda registrada en el job (FAILED)."""
+    job = ImportJob.objects.select_related('account', 'upload').get(pk=job_id)
+
+    def save_progress(report):
+        ImportJob.objects.filter(pk=job_id).update(
+            rows_processed=report['processed'],
+            imported=report['imported'],
+            duplicated=report['duplicated'],
+            failed=report['failed'],
+            errors=report['errors'],
+        )
+
+    try:
+        with job.file.open('rb') as file_obj:
+            process_import(
+                file_obj, job.filename, job.mapping, job.account, progress=save_progress,
+                upload_hash=job.upload.sha256 if job.upload else None
+            )
+    except Exception as e:
+        logger.exception("Importación %s falló", job_id)
+        ImportJob.objects.filter(pk=job_id).update(
+            status=ImportJob.Status.FAILED, error_message=str(e), finished_at=timezone.now()
+        )
+    else:
+        ImportJob.objects.filter(pk=job_id).update(status=ImportJob.Status.DONE, finished_at=timezone.now())
+    return ImportJob.objects.get(pk=job_id)
+
+
+def requeue_interrupted_jobs():
+    """
+    Jobs del pool que quedaron RUNNING porque el scheduler se cayó vuelven a la cola.
+    Sólo los del pool: los que tomó otro proceso (import_files) pueden seguir corriendo.
+    Reprocesar es seguro: lo ya insertado sale como duplicado.
+    """
+    return ImportJob.objects.filter(status=ImportJob.Status.RUNNING, claimed_by=POOL_WORKER).update(
+        status=ImportJob.Status.PENDING, claimed_by='', started_at=None, rows_processed=0,
+        imported=0, duplicated=0, failed=0, errors=[]
+    )
+
+
+class ImportWorkerPool:
+    """Pool de threads que consulta la cola cada `poll_seconds` (corre dentro de run_scheduler)."""
+
+    def __init__(self, workers=None, poll_seconds=None):
+        self.workers = workers or workers_setting()
+        self.poll_seconds = poll_seconds or poll_seconds_setting()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='import')
+        self.running = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def _run(self, job_id):
+        try:
+            run_import_job(job_id)
+        finally:
+            with self.lock:
+                self.running.discard(job_id)
+            # Cada thread tiene su propia conexión: se cierra al terminar el job
+            connection.close()
+
+    def dispatch(self):
+        """Toma tantos jobs como threads libres haya. Retorna los ids enviados al pool."""
+        with self.lock:
+            free = self.workers - len(self.running)
+        job_ids = claim_import_jobs(free)
+        for job_id in job_ids:
+            with self.lock:
+                self.running.add(job_id)
+            self.executor.submit(self._run, job_id)
+        return job_ids
+
+    def loop(self):
+        requeue_interrupted_jobs()
+        while not self.stopped.is_set():
+            close_old_connections()
+            try:
+                self.dispatch()
+            except Exception:
+                logger.exception("Error tomando importaciones pendientes")
+            self.stopped.wait(self.poll_seconds)
+
+    def start(self):
+        thread = threading.Thread(target=self.loop, name='import-dispatcher', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self, wait=True):
+        self.stopped.set()
+        self.executor.shutdown(wait=wait)
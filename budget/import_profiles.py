@@ -0,0 +1,73 @@
+"""
+Perfiles de importación: el mapeo de columnas que se usó para un formato de
+cartola en una cuenta, para no elegir las columnas cada vez.
+
+El formato se reconoce por la huella del header (ver
+import_service.header_fingerprint). Cada importación manual guarda (o
+actualiza) el perfil de su formato; las siguientes cartolas con la misma huella
+se pueden importar en un solo paso (import/auto/ o el comando import_files).
+"""
+from dataclasses import dataclass
+
+from django.utils import timezone
+
+from .import_jobs import enqueue_import
+from .models import ImportJob, ImportProfile
+from .upload_cache import preview_upload
+
+# Lo que se guarda del mapeo que arma el frontend
+MAPPING_FIELDS = (
+    'header_row', 'date_col', 'payee_col', 'amount_mode', 'amount_col',
+    'amount_in_col', 'amount_out_col', 'invert_amount',
+)
+
+
+@dataclass
+class AutoImportResult:
+    status: str  # 'queued' | 'already_imported' | 'needs_mapping'
+    preview: dict
+    profile: ImportProfile = None
+    job: ImportJob = None
+    created: bool = False  # El job es nuevo (si no, es uno anterior del mismo archivo y mapeo)
+
+
+def profile_mapping(mapping):
+    return {key: mapping[key] for key in MAPPING_FIELDS if key in mapping}
+
+
+def find_profile(account, fingerprint):
+    return ImportProfile.objects.filter(account=account, fingerprint=fingerprint).first()
+
+
+def remember_profile(account, preview, mapping, name=''):
+    """Guarda el mapeo como perfil del formato de `preview` en la cuenta (reemplaza el anterior)."""
+    defaults = {
+        'delimiter': preview.get('delimiter', ''),
+        'columns': preview['columns'],
+        'mapping': profile_mapping(mapping),
+        'last_used_at': timezone.now(),
+    }
+    # El nombre se pone al crearlo; después lo puede cambiar el usuario
+    profile, _ = ImportProfile.objects.update_or_create(
+        account=account, fingerprint=preview['fingerprint'],
+        defaults=defaults, create_defaults={**defaults, 'name': name[:100]},
+    )
+    return profile
+
+
+def auto_import(account, upload, claimed_by=''):
+    """
+    Preview + ejecución en un paso: si la cuenta tiene un perfil para el formato del
+    archivo, deja la importación en cola con ese mapeo; si no, devuelve el preview
+    para que el usuario elija las columnas (needs_mapping).
+    """
+    preview = preview_upload(upload)
+    profile = find_profile(account, preview['fingerprint'])
+    if profile is None:
+        return AutoImportResult(status='needs_mapping', preview=preview)
+
+    job, created = enqueue_import(account, upload, profile.mapping, claimed_by=claimed_by)
+    ImportProfile.objects.filter(pk=profile.pk).update(last_used_at=timezone.now())
+    if not created and job.status == ImportJob.Status.DONE:
+        return AutoImportResult(status='already_imported', preview=preview, profile=profile, job=job)
+    return AutoImportResult(status='queued', preview=preview, profile=profile, job=job, created=created)
@@ -1,160 +1,439 @@
+import numpy as np
 import pandas as pd
+from collections import Counter
+from contextlib import closing
+from dataclasses import dataclass
+from itertools import islice
 from datetime import datetime
 from decimal import Decimal
+import codecs
+import csv
 import io
 import hashlib
 import re
 
-def detect_header_row(file_obj, filename, keywords=['fecha', 'date', 'monto', 'amount', 'descripcion', 'descripción', 'description', 'cargo', 'abono', 'retiro', 'deposito']):
+HEADER_KEYWORDS = ['fecha', 'date', 'monto', 'amount', 'descripcion', 'descripción', 'description', 'cargo', 'abono', 'retiro', 'deposito']
+HEADER_SCAN_ROWS = 50
+# Muestra para detectar delimitador, encoding y header (los bancos ponen el header en las primeras líneas)
+CSV_SAMPLE_BYTES = 64 * 1024
+# Filas por bloque al importar un CSV: la memoria no crece con el tamaño del archivo
+CSV_CHUNK_ROWS = 5000
+CSV_DELIMITERS = (',', ';', '\t', '|')
+# Los .xlsx se leen fila a fila (openpyxl read-only); los .xls antiguos sólo con xlrd, enteros
+STREAMING_EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+PREVIEW_ROWS = 5
+# Filas con error que se guardan como muestra en el reporte (el contador sí es total)
+ERROR_SAMPLE_LIMIT = 20
+# Lo que no es parte de un monto (se borra al limpiar textos)
+NON_AMOUNT_CHARS = re.compile(r'[^\d.,-]')
+# Monto con punto de miles y coma decimal: "3.500", "-1.500.000", "1.234,56"
+CHILEAN_AMOUNT = re.compile(r'-?\d{1,3}(\.\d{3})+(,\d+)?')
+
+@dataclass
+class CsvLayout:
+    encoding: str
+    delimiter: str
+    header_row: int
+
+def is_csv(filename):
+    return filename.lower().endswith('.csv')
+
+def _decode_sample(raw):
+    try:
+        return raw.decode('utf-8-sig'), 'utf-8-sig'
+    except UnicodeDecodeError as e:
+        # La muestra pudo cortar un carácter multibyte al final
+        if e.start >= len(raw) - 3:
+            return raw[:e.start].decode('utf-8-sig'), 'utf-8-sig'
+        return raw.decode('latin-1'), 'latin-1'
+
+def _decodes_as_utf8(file_obj):
+    """True si el archivo completo es UTF-8 válido (se decodifica por bloques, sin guardarlo)."""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    file_obj.seek(0)
+    try:
+        for block in iter(lambda: file_obj.read(1024 * 1024), b''):
+            decoder.decode(block)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return False
+    finally:
+        file_obj.seek(0)
+    return True
+
+def _best_header_row(rows, keywords=HEADER_KEYWORDS):
+    """Índice de la fila con más palabras clave (la primera si hay empate)."""
+    best_row_idx = 0
+    max_matches = 0
+    for idx, row in enumerate(rows[:HEADER_SCAN_ROWS]):
+        row_text = " ".join(str(cell) for cell in row).lower()
+        current_matches = sum(1 for k in keywords if k in row_text)
+        if current_matches > max_matches:
+            max_matches = current_matches
+            best_row_idx = idx
+    return best_row_idx
+
+def _guess_delimiter(lines):
+    """
+    El delimitador que aparece la misma cantidad de veces en más líneas.
+    (csv.Sniffer se confunde con los encabezados de cartola que traen los bancos.)
+    """
+    best, best_score = ',', (0, 0)
+    for delimiter in CSV_DELIMITERS:
+        per_line = Counter(line.count(delimiter) for line in lines)
+        per_line.pop(0, None)
+        if not per_line:
+            continue
+        fields, matching_lines = max(per_line.items(), key=lambda item: (item[1], item[0]))
+        if (matching_lines, fields) > best_score:
+            best, best_score = delimiter, (matching_lines, fields)
+    return best
+
+def detect_csv_layout(file_obj):
+    """
+    Encoding, delimitador y fila de header. El delimitador y el header salen del
+    comienzo del archivo; el encoding, del archivo completo (es sólo decodificar).
+    header_row cuenta las líneas no vacías, igual que `header=` de pandas.
+    """
+    file_obj.seek(0)
+    raw = file_obj.read(CSV_SAMPLE_BYTES)
+    sample, encoding = _decode_sample(raw)
+    # Una cartola latin-1 puede traer su primer acento después de la muestra: se revisa
+    # el archivo entero antes de importar, para no fallar con bloques ya insertados
+    if encoding == 'utf-8-sig' and not _decodes_as_utf8(file_obj):
+        sample, encoding = raw.decode('latin-1'), 'latin-1'
+    file_obj.seek(0)
+
+    lines = [line for line in sample.splitlines() if line.strip()]
+    delimiter = _guess_delimiter(lines)
+    rows = list(csv.reader(lines[:HEADER_SCAN_ROWS], delimiter=delimiter))
+    return CsvLayout(encoding=encoding, delimiter=delimiter, header_row=_best_header_row(rows))
+
+def read_csv_chunks(file_obj, layout, header_row, chunksize=None):
+    """
+    Iterador de DataFrames de a `chunksize` filas (parser C, sin volver a adivinar el formato).
+    Todo como texto: cada bloque inferiría tipos por su cuenta, y "3.500" no es 3,5 sino
+    tres mil quinientos (clean_decimal interpreta el formato chileno).
+    """
+    file_obj.seek(0)
+    return pd.read_csv(
+        file_obj, sep=layout.delimiter, encoding=layout.encoding, header=header_row,
+        dtype=str, chunksize=chunksize or CSV_CHUNK_ROWS
+    )
+
+def is_streaming_excel(filename):
+    return filename.lower().endswith(STREAMING_EXCEL_EXTENSIONS)
+
+def iter_excel_rows(file_obj):
+    """
+    Filas (tuplas de valores) de la primera hoja con openpyxl en modo read-only:
+    el XML de la hoja se recorre a medida que se piden filas, sin cargar el libro.
+    """
+    from openpyxl import load_workbook
+
+    file_obj.seek(0)
+    workbook = load_workbook(file_obj, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+def _excel_header_names(cells):
+    """Nombres de columna como los arma pd.read_excel: "Unnamed: i" para vacías, "X.1" para repetidas."""
+    names, repeats = [], Counter()
+    for i, cell in enumerate(cells):
+        base = f"Unnamed: {i}" if cell is None or str(cell).strip() == '' else str(cell)
+        name = base
+        while name in names:
+            repeats[base] += 1
+            name = f"{base}.{repeats[base]}"
+        names.append(name)
+    return names
+
+def _rows_to_frame(rows, columns, start):
+    width = len(columns)
+    rows = [tuple(row[:width]) + (None,) * (width - len(row)) for row in rows]
+    return pd.DataFrame(rows, columns=columns, index=pd.RangeIndex(start, start + len(rows)), dtype=object)
+
+def excel_row_chunks(rows, header_row, chunksize=None):
+    """
+    DataFrames de a `chunksize` filas a partir de las filas crudas de la hoja, con el
+    mismo header y las mismas filas que pd.read_excel(header=header_row): header_row
+    cuenta también las filas vacías, que se conservan salvo las del final.
+    Los valores quedan tal como vienen de la celda (texto como texto: "4.200" no es 4,2).
+    """
+    chunksize = chunksize or CSV_CHUNK_ROWS
+    rows = iter(rows)
+    header = next(islice(rows, header_row, None), None)
+    if header is None:
+        return
+    columns = _excel_header_names(header)
+
+    buffer, blanks, start = [], [], 0
+    for row in rows:
+        if all(cell is None for cell in row):
+            # Una fila vacía sólo cuenta si después vienen datos
+            blanks.append(row)
+            continue
+        buffer += blanks
+        blanks = []
+        buffer.append(row)
+        if len(buffer) >= chunksize:
+            yield _rows_to_frame(buffer[:chunksize], columns, start)
+            start += chunksize
+            buffer = buffer[chunksize:]
+    if buffer:
+        yield _rows_to_frame(buffer, columns, start)
+
+def read_excel_chunks(file_obj, filename, header_row, chunksize=None, upload_hash=None):
+    """Iterador de DataFrames del Excel: en streaming para .xlsx, el libro entero (cacheado) para .xls."""
+    if is_streaming_excel(filename):
+        return excel_row_chunks(iter_excel_rows(file_obj), header_row, chunksize)
+    return iter([read_excel_frame(file_obj, header_row, upload_hash)])
+
+def detect_header_row(file_obj, filename, keywords=HEADER_KEYWORDS):
     try:
+        if is_csv(filename):
+            return detect_csv_layout(file_obj).header_row
+        if is_streaming_excel(filename):
+            with closing(iter_excel_rows(file_obj)) as rows:
+                scanned = list(islice(rows, HEADER_SCAN_ROWS))
+            return _best_header_row([['' if cell is None else cell for cell in row] for row in scanned], keywords)
         # Leemos sin header para encontrar la fila correcta
-        if filename.endswith('.csv'):
-            df_preview = pd.read_csv(file_obj, sep=None, engine='python', header=None, nrows=50)
-        else:
-            df_preview = pd.read_excel(file_obj, header=None, nrows=50)
-        
-        best_row_idx = 0
-        max_matches = 0
-        
-        for idx, row in df_preview.iterrows():
-            row_text = " ".join(row.astype(str).tolist()).lower()
-            current_matches = sum(1 for k in keywords if k in row_text)
-            if current_matches > max_matches:
-                max_matches = current_matches
-                best_row_idx = idx
-                
-        return best_row_idx
+        df_preview = pd.read_excel(file_obj, header=None, nrows=HEADER_SCAN_ROWS)
+        return _best_header_row(df_preview.astype(str).values.tolist(), keywords)
     except Exception as e:
         print(f"Error detectando header: {e}")
         return 0
 
-def preview_file(file_obj, filename):
+def _column_names(columns):
+    # Columnas sin título quedan seleccionables en el frontend
+    return [str(col) if 'Unnamed' not in str(col) else f"Columna {i+1} (Sin Título)" for i, col in enumerate(columns)]
+
+def read_excel_frame(file_obj, header_row, upload_hash=None):
+    """El Excel completo (.xls); con upload_hash (archivo guardado) pasa por el cache en disco de upload_cache."""
+    if upload_hash:
+        from budget.upload_cache import cached_excel_frame
+        return cached_excel_frame(file_obj, upload_hash, header_row)
+    file_obj.seek(0)
+    return pd.read_excel(file_obj, header=header_row)
+
+def header_fingerprint(columns, delimiter=''):
+    """
+    Huella del formato de una cartola: columnas del header (sin mayúsculas ni espacios
+    extra) y delimitador. Identifica el banco/formato aunque cambien los datos o el nombre.
+    """
+    names = "\x1f".join(" ".join(str(col).split()).lower() for col in columns)
+    return hashlib.sha256(f"{names}\x1e{delimiter}".encode('utf-8')).hexdigest()
+
+def preview_file(file_obj, filename, upload_hash=None):
     try:
-        header_idx = detect_header_row(file_obj, filename)
-        file_obj.seek(0)
-        
-        if filename.endswith('.csv'):
-            df = pd.read_csv(file_obj, sep=None, engine='python', header=header_idx)
+        delimiter = ''
+        if is_csv(filename):
+            # Un solo sniff del comienzo del archivo; no se lee el resto
+            layout = detect_csv_layout(file_obj)
+            header_idx, delimiter = layout.header_row, layout.delimiter
+            df = next(iter(read_csv_chunks(file_obj, layout, header_idx, chunksize=PREVIEW_ROWS)), pd.DataFrame())
+        elif is_streaming_excel(filename):
+            # Sólo las primeras filas de la hoja: header + muestra, en una pasada
+            with closing(iter_excel_rows(file_obj)) as rows:
+                scanned = list(islice(rows, HEADER_SCAN_ROWS + PREVIEW_ROWS))
+            header_idx = _best_header_row([['' if cell is None else cell for cell in row] for row in scanned])
+            df = next(excel_row_chunks(scanned, header_idx, chunksize=PREVIEW_ROWS), pd.DataFrame())
         else:
-            df = pd.read_excel(file_obj, header=header_idx)
+            header_idx = detect_header_row(file_obj, filename)
+            df = read_excel_frame(file_obj, header_idx, upload_hash)
             
         # CAMBIO: NO filtramos las columnas Unnamed. 
         # Permitimos que el usuario las vea por si ahí está el dato real.
         # df = df.loc[:, ~df.columns.str.contains('^Unnamed')] 
         
         # Renombrar columnas vacías para que sean seleccionables en el frontend
-        df.columns = [str(col) if 'Unnamed' not in str(col) else f"Columna {i+1} (Sin Título)" for i, col in enumerate(df.columns)]
+        df.columns = _column_names(df.columns)
 
         columns = df.columns.tolist()
-        sample_data = df.head(5).astype(object).where(pd.notnull(df), None).to_dict(orient='records')
+        sample_data = df.head(PREVIEW_ROWS).astype(object).where(pd.notnull(df), None).to_dict(orient='records')
         
         return {
             "columns": columns,
             "sample": sample_data,
-            "detected_header_row": header_idx
+            "detected_header_row": header_idx,
+            "delimiter": delimiter,
+            "fingerprint": header_fingerprint(columns, delimiter)
         }
     except Exception as e:
         raise ValueError(f"Error procesando archivo: {str(e)}")
 
-def process_import(file_obj, filename, mapping, account, dry_run=False):
-    header_idx = mapping.get('header_row', 0)
-    file_obj.seek(0)
-    
-    if filename.endswith('.csv'):
-        df = pd.read_csv(file_obj, sep=None, engine='python', header=header_idx)
+def _clean_amount_values(values):
+    """Montos (float64) de una Series object con valores distintos: texto chileno o números."""
+    # Columnas object pueden mezclar texto con números que ya vienen de Excel (o tener sólo números)
+    if pd.api.types.infer_dtype(values, skipna=True) == 'string':
+        is_text = pd.Series(True, index=values.index)
     else:
-        df = pd.read_excel(file_obj, header=header_idx)
+        is_text = values.map(lambda value: isinstance(value, str)).astype(bool)
+    numbers = pd.to_numeric(values.where(~is_text), errors='coerce')
+    if not is_text.any():
+        return numbers.fillna(0).astype('float64')
+
+    # Si viene formato "1 / 0" (TC Banco Chile) tomamos el primero, y se quita todo lo
+    # que no sea número, punto, coma o menos ($, CLP, espacios)
+    text = values.where(is_text).map(
+        lambda value: NON_AMOUNT_CHARS.sub('', value.partition('/')[0]), na_action='ignore'
+    )
+
+    # El punto es de miles sólo si todos los montos con punto tienen formato chileno
+    # ("3.500", "1.500.000", "1.234,56"); si no ("-45000.00", "1,234.56"), es decimal
+    dotted = text.dropna()
+    dotted = dotted[dotted.str.contains('.', regex=False) & dotted.str.contains(r'\d', regex=True)]
+    if dotted.str.fullmatch(CHILEAN_AMOUNT).all():
+        text = text.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    else:
+        text = text.str.replace(',', '', regex=False)
+
+    return pd.to_numeric(text, errors='coerce').fillna(numbers).fillna(0).astype('float64')
+
+def clean_amounts(column):
+    """
+    Versión vectorizada de la limpieza de montos: float64, con 0 donde no hay número.
+    Los textos siguen el formato chileno (punto de miles, coma decimal), salvo que
+    la columna traiga montos con punto decimal ("-45000.00").
+    En una cartola los montos se repiten mucho: se limpia cada valor distinto una
+    vez (factorize) y se reparte a las filas.
+    """
+    if pd.api.types.is_numeric_dtype(column):
+        return column.astype('float64').fillna(0)
+
+    codes, uniques = pd.factorize(column)
+    cleaned = _clean_amount_values(pd.Series(np.asarray(uniques, dtype=object), dtype=object)).to_numpy()
+    # Código -1: celda vacía
+    values = np.where(codes >= 0, cleaned[codes] if len(cleaned) else 0.0, 0.0)
+    return pd.Series(values, index=column.index, dtype='float64')
+
+def parse_dates(column):
+    """
+    Fechas de la columna (NaT donde no hay): los textos en formato día/mes/año y las
+    celdas de fecha de Excel tal cual. Mezclados en un solo to_datetime, pandas
+    abandona el parser vectorizado y pasa cada valor por dateutil.
+    """
+    if column.dtype != object or pd.api.types.infer_dtype(column, skipna=True) in ('string', 'empty'):
+        return pd.to_datetime(column, dayfirst=True, errors='coerce')
+    parsed = pd.to_datetime(column.where(column.map(type) == str), dayfirst=True, errors='coerce')
+    cells = column.map(lambda value: isinstance(value, datetime))
+    if cells.any():
+        parsed = parsed.fillna(pd.to_datetime(column.where(cells), errors='coerce'))
+    return parsed
+
+def amount_text(amount):
+    """Monto como texto decimal ("3500", "-12.5") para el import_id y el Decimal final."""
+    if amount == int(amount):
+        return str(int(amount))
+    return str(amount)
+
+def _frame_to_dtos(df, mapping, problems=None):
+    """
+    DTOs de las filas de un DataFrame (un bloque del archivo) según el mapeo del usuario.
+    Si se pasa `problems` (lista), se agregan las filas descartadas por error como
+    (número de fila de datos, mensaje, valores); las filas vacías o con monto 0 se omiten sin más.
+    """
+    from budget.importers.base import TransactionDTO
 
     # Renombrar igual que en el preview para que el mapeo coincida
-    df.columns = [str(col) if 'Unnamed' not in str(col) else f"Columna {i+1} (Sin Título)" for i, col in enumerate(df.columns)]
+    df.columns = _column_names(df.columns)
     df.columns = df.columns.str.strip()
-    
-    from budget.services import create_transaction_from_dto
-    from budget.importers.base import TransactionDTO
-    
-    imported_count = 0
-    duplicated_count = 0
-    date_col = mapping.get('date_col')
-    
+
     # Parser de fecha estándar (sin inyectar años mágicos)
-    df['parsed_date'] = pd.to_datetime(df[date_col], dayfirst=True, errors='coerce')
-    df_clean = df.dropna(subset=['parsed_date'])
+    parsed_date = parse_dates(df[mapping.get('date_col')])
 
-    def clean_decimal(val):
-        if pd.isnull(val) or val == '': return Decimal(0)
-        if isinstance(val, (int, float)): return Decimal(val)
-        
-        val_str = str(val).strip()
-        
-        # Limpieza robusta de texto
-        # 1. Quitamos moneda
-        val_str = val_str.replace('$', '').replace('CLP', '').strip()
-        
-        # 2. Si viene formato "1 / 0" (TC Banco Chile), intentamos tomar el primero
-        if '/' in val_str:
-            parts = val_str.split('/')
-            val_str = parts[0].strip()
+    def column_amounts(key):
+        col = mapping.get(key)
+        return clean_amounts(df[col]) if col else pd.Series(0.0, index=df.index)
 
-        # 3. Formato numérico
-        val_str = val_str.replace('.', '').replace(',', '.')
-        
-        # 4. Quitar cualquier caracter que no sea número, punto o menos
-        val_str = re.sub(r'[^\d.-]', '', val_str)
+    if mapping.get('amount_mode') == 'single' and mapping.get('amount_col'):
+        amounts = column_amounts('amount_col')
+        if mapping.get('invert_amount', False):
+            amounts = -amounts
+    else:
+        amounts = column_amounts('amount_in_col').abs() - column_amounts('amount_out_col').abs()
 
-        try:
-            return Decimal(val_str)
-        except:
-            return Decimal(0)
+    keep = parsed_date.notna() & (amounts != 0)
 
-    should_invert = mapping.get('invert_amount', False)
+    if problems is not None:
+        # Fecha con texto que no se pudo leer (totales al pie, formatos raros)
+        raw_date = df[mapping.get('date_col')]
+        bad_date = parsed_date.isna() & raw_date.notna() & (raw_date.astype(str).str.strip() != '')
+        for idx in bad_date[bad_date].index:
+            problems.append((int(idx) + 1, f"Fecha inválida: {raw_date[idx]!r}", df.loc[idx]))
 
-    for _, row in df_clean.iterrows():
-        try:
-            amount = Decimal(0)
-            
-            if mapping.get('amount_mode') == 'single' and mapping.get('amount_col'):
-                amount = clean_decimal(row[mapping['amount_col']])
-                if should_invert:
-                    amount = amount * -1
-            else:
-                inc_val = Decimal(0)
-                out_val = Decimal(0)
-                if mapping.get('amount_in_col'): inc_val = clean_decimal(row[mapping['amount_in_col']])
-                if mapping.get('amount_out_col'): out_val = clean_decimal(row[mapping['amount_out_col']])
-                amount = abs(inc_val) - abs(out_val)
-
-            if amount == 0:
-                continue
-
-            payee_text = "Sin descripción"
-            if mapping.get('payee_col'):
-                val = row[mapping['payee_col']]
-                if pd.notnull(val):
-                    payee_text = str(val).strip()
-
-            tx_date = row['parsed_date'].date()
-            raw_id_string = f"{tx_date}-{payee_text}-{abs(amount)}"
-            import_id = hashlib.md5(raw_id_string.encode('utf-8')).hexdigest()
-
-            dto = TransactionDTO(
-                date=tx_date,
-                payee=payee_text,
-                amount=amount,
-                memo="Importado manual",
-                import_id=import_id
-            )
-            
-            if not dry_run:
-                _, created = create_transaction_from_dto(account, dto)
+    amounts, parsed_date = amounts[keep], parsed_date[keep]
+
+    if mapping.get('payee_col'):
+        raw = df.loc[keep, mapping['payee_col']]
+        payees = raw.astype(str).str.strip().where(raw.notna(), "Sin descripción")
+    else:
+        payees = pd.Series("Sin descripción", index=amounts.index)
+
+    # Fechas y montos se repiten: date, texto y Decimal se arman una vez por valor distinto
+    # (los Decimal son inmutables, así que las filas pueden compartirlos)
+    date_codes, date_values = pd.factorize(parsed_date)
+    days = [value.date() for value in date_values]
+    day_texts = [day.isoformat() for day in days]
+    amount_codes, amount_values = pd.factorize(amounts)
+    amount_texts = [amount_text(value) for value in amount_values.tolist()]
+    decimals = [Decimal(text) for text in amount_texts]
+    abs_texts = [text.lstrip('-') for text in amount_texts]
+
+    # import_id: md5 de "fecha-descripción-monto absoluto" (mismo formato de siempre)
+    md5 = hashlib.md5
+    return [
+        TransactionDTO(
+            date=days[date_code],
+            payee=payee_text,
+            amount=decimals[amount_code],
+            memo="Importado manual",
+            import_id=md5(f"{day_texts[date_code]}-{payee_text}-{abs_texts[amount_code]}".encode('utf-8')).hexdigest()
+        )
+        for date_code, amount_code, payee_text in zip(date_codes.tolist(), amount_codes.tolist(), payees.tolist())
+    ]
+
+def _row_values(values):
+    """Valores de una fila listos para JSON (NaN -> None)."""
+    return {str(col): (None if pd.isnull(value) else str(value)) for col, value in values.items()}
+
+def process_import(file_obj, filename, mapping, account, dry_run=False, chunk_rows=None, progress=None, upload_hash=None):
+    """
+    Importa el archivo según el mapeo. Los CSV y .xlsx se leen de a CSV_CHUNK_ROWS filas
+    y cada bloque se deduplica e inserta (y confirma) antes de leer el siguiente.
+    progress(report) se llama después de cada bloque (ver import_jobs.py).
+    upload_hash: el archivo es un ImportUpload y el Excel ya leído en el preview se reutiliza.
+    """
+    from budget.services import create_transactions_from_dtos
+
+    header_idx = mapping.get('header_row', 0)
+    file_obj.seek(0)
+    
+    if is_csv(filename):
+        frames = read_csv_chunks(file_obj, detect_csv_layout(file_obj), header_idx, chunk_rows)
+    else:
+        frames = read_excel_chunks(file_obj, filename, header_idx, chunk_rows, upload_hash)
+
+    report = {"processed": 0, "imported": 0, "duplicated": 0, "failed": 0, "errors": []}
+
+    for df in frames:
+        problems = []
+        dtos = _frame_to_dtos(df, mapping, problems)
+        report["processed"] += len(df)
+        report["failed"] += len(problems)
+        for row, message, values in problems[:ERROR_SAMPLE_LIMIT - len(report["errors"])]:
+            report["errors"].append({"row": row, "error": message, "values": _row_values(values)})
+
+        if not dry_run:
+            # Dedupe e inserción por lotes (pocas consultas por cada mil filas)
+            for _, created in create_transactions_from_dtos(account, dtos):
                 if created:
-                    imported_count += 1
+                    report["imported"] += 1
                 else:
-                    duplicated_count += 1
-            
-        except Exception:
-            continue
+                    report["duplicated"] += 1
+        if progress:
+            progress(report)
 
-    return {
-        "imported": imported_count,
-        "duplicated": duplicated_count
-    }
\ No newline at end of file
+    return report
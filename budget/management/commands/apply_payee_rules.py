@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from budget.rule_service import apply_payee_rules, BATCH_SIZE
+
+class Command(BaseCommand):
+    help = 'Aplica las reglas de Payee (y su categoría por defecto) a las transacciones existentes sin payee o sin categoría'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Muestra lo que cambiaría sin guardar nada')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help=f'Transacciones por lote (por defecto {BATCH_SIZE})')
+
+    def handle(self, *args, **options):
+        def report(result):
+            self.stdout.write(f"   {result.scanned}/{result.total} revisadas, {result.changed} con cambios")
+
+        result = apply_payee_rules(dry_run=options['dry_run'], batch_size=options['batch_size'], progress=report)
+
+        if options['dry_run']:
+            for change in result.preview:
+                self.stdout.write(
+                    f"   #{change['id']} {change['date']} '{change['raw_payee']}' -> "
+                    f"payee: {change['payee'] or '-'}, categoría: {change['category'] or '-'}"
+                )
+            if result.changed > len(result.preview):
+                self.stdout.write(f"   ... y {result.changed - len(result.preview)} más")
+            self.stdout.write(self.style.WARNING(
+                f"Simulación: {result.changed} transacciones cambiarían "
+                f"({result.payees_set} payees, {result.categories_set} categorías). Nada fue guardado."
+            ))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Reglas aplicadas: {result.changed} transacciones "
+            f"({result.payees_set} payees, {result.categories_set} categorías)."
+        ))
@@ -4,7 +4,8 @@ from email.header import decode_header
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from budget.models import EmailSource
-from budget.services import create_transaction_from_dto
+from budget.services import create_transactions_from_dtos
+from budget.transfer_matcher import detect_recent_transfers
 from budget.importers.cl_bancochile import BancoChileImporter
 
 class Command(BaseCommand):
@@ -17,6 +18,10 @@ class Command(BaseCommand):
         for source in sources:
             self.process_source(source)
 
+        # Las dos mitades de una transferencia suelen llegar en correos distintos
+        result = detect_recent_transfers()
+        self.stdout.write(f"🔗 Transferencias: {len(result.linked)} vinculadas, {result.queued} pares para revisión.")
+
     def process_source(self, source):
         self.stdout.write(f"🔌 Conectando a fuente: {source.name} ({source.email_user})")
         
@@ -123,8 +128,7 @@ class Command(BaseCommand):
 
                             # Guardar Transacciones
                             if dtos:
-                                for dto in dtos:
-                                    tx, created = create_transaction_from_dto(rule.account, dto)
+                                for tx, created in create_transactions_from_dtos(rule.account, dtos):
                                     if created:
                                         self.stdout.write(self.style.SUCCESS(f"       + {tx.raw_payee} | ${tx.amount}"))
                                         count_saved += 1
@@ -0,0 +1,49 @@
+import os
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from budget.models import Account, ImportJob
+from budget.import_jobs import run_import_job
+from budget.import_profiles import auto_import
+from budget.upload_cache import store_upload
+
+class Command(BaseCommand):
+    help = 'Importa cartolas (Excel/CSV) con el perfil guardado para su formato; pensado para cargar meses atrasados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('account_name', type=str)
+        parser.add_argument('files', nargs='+', help='Archivos a importar (en orden)')
+
+    def handle(self, *args, **options):
+        try:
+            account = Account.objects.get(name=options['account_name'])
+        except Account.DoesNotExist:
+            raise CommandError("Cuenta no encontrada")
+
+        for path in options['files']:
+            name = os.path.basename(path)
+            with open(path, 'rb') as f:
+                upload = store_upload(File(f, name=name))
+            # El job nace tomado: se procesa aquí mismo y el pool del scheduler no lo toca
+            result = auto_import(account, upload, claimed_by='import_files')
+
+            if result.status == 'needs_mapping':
+                self.stdout.write(self.style.WARNING(
+                    f"{name}: formato sin perfil en esta cuenta. Impórtalo una vez desde la app para guardar el mapeo."
+                ))
+                continue
+
+            job = result.job
+            if result.created:
+                job = run_import_job(job.id)
+            elif result.status == 'queued':
+                self.stdout.write(f"{name}: ya estaba en cola o procesándose (job {job.id}).")
+                continue
+
+            if job.status == ImportJob.Status.FAILED:
+                self.stdout.write(self.style.ERROR(f"{name}: falló ({job.error_message})"))
+                continue
+            prefix = "ya importado antes: " if result.status == 'already_imported' else ""
+            self.stdout.write(self.style.SUCCESS(
+                f"{name}: {prefix}{job.imported} nuevas, {job.duplicated} duplicadas, {job.failed} con error "
+                f"(perfil '{result.profile.name}')."
+            ))
@@ -0,0 +1,33 @@
+from datetime import datetime, date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from budget.transfer_matcher import detect_transfers, lookback_days_setting
+
+class Command(BaseCommand):
+    help = 'Detecta transferencias entre cuentas propias: vincula los pares seguros y deja el resto para revisión'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Revisar desde esta fecha (YYYY-MM-DD). Por defecto, TRANSFER_MATCH_LOOKBACK_DAYS días atrás')
+        parser.add_argument('--all', action='store_true', help='Revisar todo el historial')
+        parser.add_argument('--window-days', type=int, help='Máxima diferencia de días entre salida y entrada')
+        parser.add_argument('--review-only', action='store_true', help='No vincular nada: dejar todos los pares para revisión')
+        parser.add_argument('--dry-run', action='store_true', help='Sólo mostrar cuántos pares se encontrarían')
+
+    def handle(self, *args, **options):
+        since = None if options['all'] else date.today() - timedelta(days=lookback_days_setting())
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("Formato de fecha inválido (YYYY-MM-DD)")
+
+        result = detect_transfers(
+            since=since,
+            window_days=options['window_days'],
+            auto_link=not options['review_only'],
+            dry_run=options['dry_run'],
+        )
+        prefix = "Simulación: " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{result.scanned} transacciones sin vincular revisadas, "
+            f"{len(result.linked)} transferencias vinculadas, {result.queued} pares para revisión."
+        ))
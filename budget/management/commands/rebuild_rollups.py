@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from budget.ledger import rebuild_category_rollups, find_rollup_drift, rebuild_spending_facts, find_spending_drift
+
+class Command(BaseCommand):
+    help = 'Reconstruye (o verifica con --verify) los rollups mensuales por categoría y los hechos de gasto desde las transacciones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Solo compara contra lo recalculado, sin escribir')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            drift = find_rollup_drift()
+            for category_id, month, expected, stored in drift:
+                self.stdout.write(self.style.WARNING(
+                    f"   Categoría {category_id} {month.strftime('%Y-%m')}: esperado {expected}, guardado {stored}"
+                ))
+            spending_drift = find_spending_drift()
+            for (month, category_id, payee_id, account_id), expected, stored in spending_drift:
+                self.stdout.write(self.style.WARNING(
+                    f"   Gasto {month.strftime('%Y-%m')} cat {category_id} payee {payee_id} cuenta {account_id}: "
+                    f"esperado {expected}, guardado {stored}"
+                ))
+
+            if not drift and not spending_drift:
+                self.stdout.write(self.style.SUCCESS("Rollups OK: coinciden con las transacciones."))
+                return
+            self.stdout.write(self.style.ERROR(
+                f"{len(drift) + len(spending_drift)} diferencias. Ejecuta sin --verify para reconstruir."
+            ))
+            return
+
+        count = rebuild_category_rollups()
+        facts = rebuild_spending_facts()
+        self.stdout.write(self.style.SUCCESS(f"Rollups reconstruidos: {count} filas, {facts} hechos de gasto."))
@@ -7,6 +7,7 @@ from django.core.management import call_command
 from django_apscheduler.jobstores import DjangoJobStore
 from django_apscheduler.models import DjangoJobExecution
 from django_apscheduler import util
+from budget.import_jobs import ImportWorkerPool
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +16,10 @@ def fetch_emails_job():
     print("⏰ Ejecutando tarea programada: fetch_emails")
     call_command('fetch_emails')
 
+def snapshot_balances_job():
+    print("⏰ Ejecutando tarea programada: snapshot_balances")
+    call_command('snapshot_balances')
+
 @util.close_old_connections
 def delete_old_job_executions(max_age=604_800):
     """Elimina logs de ejecución de trabajos mayores a una semana"""
@@ -37,7 +42,17 @@ class Command(BaseCommand):
         )
         logger.info("Added job 'fetch_emails'.")
 
-        # 2. Tarea de limpieza semanal (para no llenar la BD de logs)
+        # 2. Cierres mensuales de saldo por cuenta (cada noche)
+        scheduler.add_job(
+            snapshot_balances_job,
+            trigger=CronTrigger(hour="03", minute="00"),
+            id="snapshot_balances",
+            max_instances=1,
+            replace_existing=True,
+        )
+        logger.info("Added job 'snapshot_balances'.")
+
+        # 3. Tarea de limpieza semanal (para no llenar la BD de logs)
         scheduler.add_job(
             delete_old_job_executions,
             trigger=CronTrigger(
@@ -48,6 +63,11 @@ class Command(BaseCommand):
             replace_existing=True,
         )
 
+        # 4. Importaciones de cartolas en segundo plano (pool propio, no pasa por APScheduler)
+        import_pool = ImportWorkerPool()
+        import_pool.start()
+        logger.info("Started import workers (%s).", import_pool.workers)
+
         try:
             logger.info("Starting scheduler...")
             print("🚀 Scheduler iniciado. Ejecutando fetch_emails cada 15 minutos.")
@@ -55,4 +75,5 @@ class Command(BaseCommand):
         except KeyboardInterrupt:
             logger.info("Stopping scheduler...")
             scheduler.shutdown()
+            import_pool.stop()
             print("Scheduler detenido.")
\ No newline at end of file
@@ -0,0 +1,26 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from budget.ledger import close_balance_snapshots, rebuild_balance_snapshots, last_closed_month
+
+class Command(BaseCommand):
+    help = 'Agrega los saldos de cierre mensual por cuenta (AccountBalanceSnapshot) que falten; --rebuild los regenera todos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--through', help='Último mes a generar (YYYY-MM). Por defecto, el último mes cerrado')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Borra y recalcula todos los cierres desde las transacciones (reparación)')
+
+    def handle(self, *args, **options):
+        through = last_closed_month()
+        if options['through']:
+            try:
+                through = datetime.strptime(options['through'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError("Formato de mes inválido (YYYY-MM)")
+
+        if options['rebuild']:
+            count = rebuild_balance_snapshots(through)
+            self.stdout.write(self.style.SUCCESS(f"Cierres mensuales regenerados hasta {through.strftime('%Y-%m')}: {count} filas."))
+        else:
+            count = close_balance_snapshots(through)
+            self.stdout.write(self.style.SUCCESS(f"Cierres mensuales agregados hasta {through.strftime('%Y-%m')}: {count} filas nuevas."))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from budget.ledger import find_balance_drift, rebuild_account_balances
+
+class Command(BaseCommand):
+    help = 'Verifica que Account.balance coincida con la suma de sus transacciones (y lo repara con --fix)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Recalcula los saldos desde las transacciones')
+
+    def handle(self, *args, **options):
+        drift = find_balance_drift()
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Saldos OK: coinciden con las transacciones."))
+            return
+
+        for account_id, name, stored, expected in drift:
+            self.stdout.write(self.style.WARNING(
+                f"   Cuenta {account_id} ({name}): guardado {stored}, esperado {expected}"
+            ))
+
+        if not options['fix']:
+            self.stdout.write(self.style.ERROR(f"{len(drift)} cuentas descuadradas. Ejecuta con --fix para repararlas."))
+            return
+
+        rebuild_account_balances()
+        self.stdout.write(self.style.SUCCESS(f"Saldos reparados: {len(drift)} cuentas."))
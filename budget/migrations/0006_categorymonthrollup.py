@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:53
+
+from collections import defaultdict
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Q, Sum
+from django.db.models.functions import TruncMonth
+
+
+def build_rollups(apps, schema_editor):
+    """
+    Calcula los rollups iniciales desde las asignaciones y transacciones. La lógica
+    queda copiada aquí (y no importada de budget.ledger) para que la migración no
+    cambie cuando cambie el código.
+    """
+    CategoryMonthRollup = apps.get_model('budget', 'CategoryMonthRollup')
+    Transaction = apps.get_model('budget', 'Transaction')
+    BudgetAssignment = apps.get_model('budget', 'BudgetAssignment')
+
+    assigned = {
+        (r['category'], r['period']): r['total']
+        for r in BudgetAssignment.objects.annotate(period=TruncMonth('month'))
+        .values('category', 'period').annotate(total=Sum('amount'))
+    }
+    # Actividad: gasto normal o transferencia hacia una cuenta Off-Budget
+    activity = {
+        (r['category'], r['period']): r['total']
+        for r in Transaction.objects.filter(category__isnull=False)
+        .filter(Q(transfer_transaction__isnull=True) | Q(transfer_transaction__account__off_budget=True))
+        .annotate(period=TruncMonth('date'))
+        .values('category', 'period').annotate(total=Sum('amount'))
+    }
+
+    rollups = []
+    running = defaultdict(Decimal)
+    for category_id, month in sorted(set(assigned) | set(activity)):
+        month_assigned = assigned.get((category_id, month)) or Decimal(0)
+        month_activity = activity.get((category_id, month)) or Decimal(0)
+        running[category_id] += month_assigned + month_activity
+        rollups.append(CategoryMonthRollup(
+            category_id=category_id, month=month, assigned=month_assigned,
+            activity=month_activity, available=running[category_id]
+        ))
+    CategoryMonthRollup.objects.bulk_create(rollups, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0005_category_goal_amount_category_goal_target_date_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryMonthRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('assigned', models.DecimalField(decimal_places=0, default=0, max_digits=14)),
+                ('activity', models.DecimalField(decimal_places=0, default=0, max_digits=14)),
+                ('available', models.DecimalField(decimal_places=0, default=0, max_digits=14)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='budget.category')),
+            ],
+            options={
+                'unique_together': {('category', 'month')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:00
+
+from django.db import migrations, models
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def init_balances(apps, schema_editor):
+    """Deja cada saldo en la suma de sus transacciones (lógica copiada, no importada de budget.ledger)."""
+    Account = apps.get_model('budget', 'Account')
+    Transaction = apps.get_model('budget', 'Transaction')
+    total = Transaction.objects.filter(account=OuterRef('pk')).values('account').annotate(
+        total=Sum('amount')
+    ).values('total')
+    Account.objects.update(
+        balance=Coalesce(Subquery(total), Value(0), output_field=DecimalField(max_digits=12, decimal_places=0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0006_categorymonthrollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='account',
+            name='balance',
+            field=models.DecimalField(decimal_places=0, default=0, editable=False, max_digits=12),
+        ),
+        migrations.RunPython(init_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:03
+
+from datetime import date, timedelta
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+
+def _next_month(month_start):
+    return (month_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def build_snapshots(apps, schema_editor):
+    """
+    Cierres de cada mes completo desde el primer movimiento de cada cuenta (lógica
+    copiada, no importada de budget.ledger, para que la migración no cambie).
+    """
+    AccountBalanceSnapshot = apps.get_model('budget', 'AccountBalanceSnapshot')
+    Transaction = apps.get_model('budget', 'Transaction')
+
+    # Último mes cerrado
+    through = (date.today().replace(day=1) - timedelta(days=1)).replace(day=1)
+    rows = Transaction.objects.filter(date__lt=_next_month(through)).annotate(
+        period=TruncMonth('date')
+    ).values('account', 'period').annotate(total=Sum('amount')).order_by('account', 'period')
+
+    totals = {}
+    for r in rows:
+        totals.setdefault(r['account'], {})[r['period']] = r['total']
+
+    snapshots = []
+    for account_id, months in totals.items():
+        month, running = min(months), Decimal(0)
+        while month <= through:
+            running += months.get(month, 0)
+            snapshots.append(AccountBalanceSnapshot(account_id=account_id, month=month, balance=running))
+            month = _next_month(month)
+    AccountBalanceSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0007_account_balance_maintained'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('balance', models.DecimalField(decimal_places=0, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', 'date'], name='budget_tran_account_ac451b_idx'),
+        ),
+        migrations.AddField(
+            model_name='accountbalancesnapshot',
+            name='account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='budget.account'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='accountbalancesnapshot',
+            unique_together={('account', 'month')},
+        ),
+        migrations.RunPython(build_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:09
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+
+def build_spending_facts(apps, schema_editor):
+    """Hechos de gasto iniciales desde las transacciones (lógica copiada, no importada de budget.ledger)."""
+    SpendingFact = apps.get_model('budget', 'SpendingFact')
+    Transaction = apps.get_model('budget', 'Transaction')
+    rows = Transaction.objects.filter(
+        category__isnull=False, transfer_transaction__isnull=True
+    ).annotate(period=TruncMonth('date')).values('period', 'category', 'payee', 'account').annotate(
+        outflow=Coalesce(Sum('amount', filter=Q(amount__lt=0)), Value(Decimal(0))),
+        inflow=Coalesce(Sum('amount', filter=Q(amount__gte=0)), Value(Decimal(0))),
+        count=Count('id')
+    )
+    SpendingFact.objects.bulk_create([
+        SpendingFact(month=r['period'], category_id=r['category'], payee_id=r['payee'], account_id=r['account'],
+                     outflow=r['outflow'], inflow=r['inflow'], count=r['count'])
+        for r in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0008_accountbalancesnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpendingFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('outflow', models.DecimalField(decimal_places=0, default=0, max_digits=14)),
+                ('inflow', models.DecimalField(decimal_places=0, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spending_facts', to='budget.account')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spending_facts', to='budget.category')),
+                ('payee', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='spending_facts', to='budget.payee')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('month', 'category', 'payee', 'account'), name='unique_spending_fact', nulls_distinct=False)],
+            },
+        ),
+        migrations.RunPython(build_spending_facts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:14
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+TRIGRAM_INDEXES = [
+    django.contrib.postgres.indexes.GinIndex(fields=['raw_payee'], name='transaction_raw_payee_trgm', opclasses=['gin_trgm_ops']),
+    django.contrib.postgres.indexes.GinIndex(fields=['memo'], name='transaction_memo_trgm', opclasses=['gin_trgm_ops']),
+]
+
+
+def trigram_available(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def add_trigram_indexes(apps, schema_editor):
+    # pg_trgm viene en la imagen oficial de Postgres, pero no en todas las instalaciones:
+    # sin la extensión la búsqueda funciona igual, sólo sin tolerancia a errores de tipeo
+    if not trigram_available(schema_editor):
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    model = apps.get_model('budget', 'Transaction')
+    for index in TRIGRAM_INDEXES:
+        schema_editor.add_index(model, index)
+
+
+def remove_trigram_indexes(apps, schema_editor):
+    for index in TRIGRAM_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {schema_editor.quote_name(index.name)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0010_transaction_date_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('raw_payee', config='spanish', weight='A'), '||', django.contrib.postgres.search.SearchVector('memo', config='spanish', weight='B'), django.contrib.postgres.search.SearchConfig('spanish')), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='transaction_search_idx'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='transaction', index=index) for index in TRIGRAM_INDEXES
+            ],
+            database_operations=[
+                migrations.RunPython(add_trigram_indexes, remove_trigram_indexes),
+            ],
+        ),
+    ]
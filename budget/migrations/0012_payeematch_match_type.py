@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0011_transaction_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payeematch',
+            name='match_type',
+            field=models.CharField(choices=[('CONTAINS', 'Contiene'), ('PREFIX', 'Empieza con'), ('EXACT', 'Exacto'), ('REGEX', 'Expresión regular')], default='CONTAINS', max_length=10),
+        ),
+    ]
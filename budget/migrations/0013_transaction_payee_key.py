@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:24
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def _normalize(text):
+    """Copia de models.normalize_payee_text al momento de esta migración."""
+    folded = unicodedata.normalize('NFKD', text or '')
+    folded = ''.join(char for char in folded if not unicodedata.combining(char))
+    return ' '.join(folded.lower().split())
+
+
+def fill_payee_keys(apps, schema_editor):
+    Transaction = apps.get_model('budget', 'Transaction')
+    batch = []
+    for tx in Transaction.objects.only('id', 'raw_payee').iterator(chunk_size=2000):
+        tx.payee_key = _normalize(tx.raw_payee)
+        batch.append(tx)
+        if len(batch) == 2000:
+            Transaction.objects.bulk_update(batch, ['payee_key'])
+            batch = []
+    Transaction.objects.bulk_update(batch, ['payee_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0012_payeematch_match_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='payee_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200),
+        ),
+        # Se llena antes de crear el índice
+        migrations.RunPython(fill_payee_keys, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='budget_tran_account_ac451b_idx',
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', 'date', 'amount', 'payee_key'], name='transaction_content_key'),
+        ),
+    ]
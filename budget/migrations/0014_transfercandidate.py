@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0013_transaction_payee_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransferCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day_gap', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(choices=[('PENDING', 'Pendiente'), ('REJECTED', 'Descartada')], default='PENDING', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('inflow', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='budget.transaction')),
+                ('outflow', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='budget.transaction')),
+            ],
+            options={
+                'unique_together': {('outflow', 'inflow')},
+            },
+        ),
+    ]
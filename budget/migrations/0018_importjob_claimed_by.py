@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0017_importprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+    ]
@@ -1,10 +1,15 @@
 # budget/models.py
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction as db_transaction
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.utils.translation import gettext_lazy as _
 from datetime import date
 from django.conf import settings
 from cryptography.fernet import Fernet
+from .validators import regex_problem
 import os
+import unicodedata
 
 class Account(models.Model):
     """Representa una cuenta bancaria, efectivo o tarjeta de crédito."""
@@ -22,7 +27,9 @@ class Account(models.Model):
         default=False, 
         help_text="Si es True, el saldo no suma al presupuesto y las transferencias hacia aquí requieren categoría."
     )
-    balance = models.DecimalField(max_digits=12, decimal_places=0, default=0) # CLP no usa decimales, pero es bueno dejarlos por si acaso
+    # Saldo desnormalizado: lo mantiene budget/ledger.py en la misma transacción que cada movimiento.
+    # Verificar/reparar con `manage.py verify_balances`.
+    balance = models.DecimalField(max_digits=12, decimal_places=0, default=0, editable=False) # CLP no usa decimales, pero es bueno dejarlos por si acaso
     identifier = models.CharField(max_length=50, blank=True, null=True, help_text="Identificador único en los correos (ej: últimos 4 dígitos de la tarjeta)")
     payment_category = models.OneToOneField(
         'Category',
@@ -37,6 +44,16 @@ class Account(models.Model):
         id_str = f" [...{self.identifier}]" if self.identifier else ""
         return f"{self.name}{id_str} ({self.get_account_type_display()})"
 
+    def save(self, *args, **kwargs):
+        # El saldo sólo se toca con F() desde el ledger: un save() con la instancia vieja no debe pisarlo
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields if not f.primary_key and f.name != 'balance'
+            ]
+        # Si cambia off_budget, las señales recalculan la actividad en la misma transacción
+        with db_transaction.atomic():
+            super().save(*args, **kwargs)
+
 class CategoryGroup(models.Model):
     name = models.CharField(max_length=100)
     # is_active para soft delete de grupos también
@@ -98,6 +115,47 @@ class BudgetAssignment(models.Model):
 
     def __str__(self):
         return f"{self.month.strftime('%Y-%m')} - {self.category.name}: {self.amount}"
+
+    def save(self, *args, **kwargs):
+        # Las señales que actualizan los rollups corren dentro de la misma transacción de BD
+        with db_transaction.atomic():
+            super().save(*args, **kwargs)
+
+class CategoryMonthRollup(models.Model):
+    """
+    Resumen persistido de una categoría en un mes: asignado, actividad y
+    disponible acumulado al cierre del mes. Se mantiene incrementalmente
+    (ver budget/ledger.py) y se puede reconstruir con `rebuild_rollups`.
+    Los meses sin fila arrastran el disponible del último mes con fila.
+    """
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='rollups')
+    month = models.DateField() # Día 1 del mes
+    assigned = models.DecimalField(max_digits=14, decimal_places=0, default=0)
+    activity = models.DecimalField(max_digits=14, decimal_places=0, default=0)
+    available = models.DecimalField(max_digits=14, decimal_places=0, default=0)
+
+    class Meta:
+        unique_together = ('category', 'month')
+
+    def __str__(self):
+        return f"{self.month.strftime('%Y-%m')} - {self.category.name}: {self.available}"
+
+class AccountBalanceSnapshot(models.Model):
+    """
+    Saldo de una cuenta al cierre de cada mes. Lo construye el job nocturno
+    (`snapshot_balances`) y el ledger lo corrige cuando llega una transacción
+    con fecha pasada. Saldo a una fecha D = último cierre antes del mes de D
+    + movimientos desde entonces (ver budget/balance_service.py).
+    """
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='balance_snapshots')
+    month = models.DateField() # Día 1 del mes; el saldo es al último día de ese mes
+    balance = models.DecimalField(max_digits=14, decimal_places=0, default=0)
+
+    class Meta:
+        unique_together = ('account', 'month')
+
+    def __str__(self):
+        return f"{self.month.strftime('%Y-%m')} - {self.account.name}: {self.balance}"
     
 class Payee(models.Model):
     """
@@ -117,12 +175,38 @@ class PayeeMatch(models.Model):
     Reglas para detectar un Payee en el texto sucio del banco.
     Ej: Si el texto contiene "TRBK LID", asigna al Payee "Lider".
     """
+    class MatchType(models.TextChoices):
+        CONTAINS = 'CONTAINS', _('Contiene')
+        PREFIX = 'PREFIX', _('Empieza con')
+        EXACT = 'EXACT', _('Exacto')
+        REGEX = 'REGEX', _('Expresión regular')
+
     payee = models.ForeignKey(Payee, on_delete=models.CASCADE, related_name='match_rules')
     pattern = models.CharField(max_length=200, help_text="Texto o Regex para buscar en la importación")
+    # Sin distinguir mayúsculas. Precedencia: exacto > empieza con > regex > contiene
+    match_type = models.CharField(max_length=10, choices=MatchType.choices, default=MatchType.CONTAINS)
     
     def __str__(self):
         return f"Pattern '{self.pattern}' -> {self.payee.name}"
+
+    def clean(self):
+        super().clean()
+        if self.match_type == self.MatchType.REGEX:
+            problem = regex_problem(self.pattern)
+            if problem:
+                raise ValidationError({'pattern': problem})
+
+    def save(self, *args, **kwargs):
+        # Una regex mal formada o con backtracking catastrófico nunca llega al matcher
+        self.clean()
+        super().save(*args, **kwargs)
     
+def normalize_payee_text(text):
+    """Minúsculas, sin tildes y con los espacios colapsados: 'Café  Haití ' -> 'cafe haiti'."""
+    folded = unicodedata.normalize('NFKD', text or '')
+    folded = ''.join(char for char in folded if not unicodedata.combining(char))
+    return ' '.join(folded.lower().split())
+
 class Transaction(models.Model):
     """Cada movimiento de dinero."""
     account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='transactions')
@@ -133,6 +217,8 @@ class Transaction(models.Model):
     payee = models.ForeignKey(Payee, on_delete=models.SET_NULL, null=True, blank=True, related_name='transactions')
     amount = models.DecimalField(max_digits=12, decimal_places=0) 
     raw_payee = models.CharField(max_length=200)
+    # raw_payee normalizado (ver normalize_payee_text) para detectar duplicados por contenido
+    payee_key = models.CharField(max_length=200, blank=True, default='', editable=False)
 
     transfer_transaction = models.OneToOneField(
         'self',
@@ -149,8 +235,166 @@ class Transaction(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Búsqueda de texto completo (ver budget/search.py). La calcula Postgres al guardar
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('raw_payee', weight='A', config='spanish')
+            + SearchVector('memo', weight='B', config='spanish')
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            # Duplicados por contenido (un solo probe por fila importada). Su prefijo (account, date)
+            # sirve también para los saldos a una fecha: movimientos de una cuenta desde el último cierre
+            models.Index(fields=['account', 'date', 'amount', 'payee_key'], name='transaction_content_key'),
+            # Listado y paginación por cursor: orden (-date, -id)
+            models.Index(fields=['-date', '-id'], name='transaction_date_id_desc'),
+            GinIndex(fields=['search_vector'], name='transaction_search_idx'),
+            # Tolerancia a errores de tipeo (pg_trgm). La migración 0011 sólo los crea si la extensión existe
+            GinIndex(fields=['raw_payee'], opclasses=['gin_trgm_ops'], name='transaction_raw_payee_trgm'),
+            GinIndex(fields=['memo'], opclasses=['gin_trgm_ops'], name='transaction_memo_trgm'),
+        ]
+
     def __str__(self):
         return f"{self.date} - {self.payee}: ${self.amount}"
+
+    def save(self, *args, **kwargs):
+        self.payee_key = normalize_payee_text(self.raw_payee)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'raw_payee' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'payee_key'}
+        # Las señales que actualizan los rollups corren dentro de la misma transacción de BD
+        with db_transaction.atomic():
+            super().save(*args, **kwargs)
+
+class SpendingFact(models.Model):
+    """
+    Gasto agregado por (mes, categoría, payee, cuenta) para el reporte de gastos.
+    Sólo transacciones con categoría que no son transferencias. Se mantiene
+    incrementalmente desde budget/ledger.py (se reconstruye con `rebuild_rollups`).
+    """
+    month = models.DateField() # Día 1 del mes
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='spending_facts')
+    payee = models.ForeignKey(Payee, on_delete=models.CASCADE, null=True, blank=True, related_name='spending_facts')
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='spending_facts')
+    outflow = models.DecimalField(max_digits=14, decimal_places=0, default=0) # Suma de montos negativos
+    inflow = models.DecimalField(max_digits=14, decimal_places=0, default=0) # Devoluciones/reembolsos
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # payee NULL también es una llave (transacciones sin payee)
+            models.UniqueConstraint(
+                fields=['month', 'category', 'payee', 'account'],
+                name='unique_spending_fact', nulls_distinct=False
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.month.strftime('%Y-%m')} - {self.category_id}/{self.payee_id}/{self.account_id}: {self.outflow}"
+
+class TransferCandidate(models.Model):
+    """
+    Posible transferencia entre cuentas propias que el detector no pudo vincular
+    solo (más de un par posible). Queda pendiente hasta que el usuario la acepte o descarte.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', _('Pendiente')
+        REJECTED = 'REJECTED', _('Descartada')
+
+    outflow = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='+')
+    inflow = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='+')
+    day_gap = models.PositiveIntegerField(default=0) # Días entre la salida y la entrada
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('outflow', 'inflow')
+
+    def __str__(self):
+        return f"{self.outflow_id} -> {self.inflow_id} ({self.get_status_display()})"
+
+def import_upload_path(instance, filename):
+    # Un archivo por contenido; la extensión decide si se lee como CSV o Excel
+    return f"imports/{instance.sha256}{os.path.splitext(filename)[1].lower()}"
+
+class ImportUpload(models.Model):
+    """
+    Cartola subida para importar, guardada una sola vez por contenido (sha256).
+    Preview y ejecución se refieren a ella por el hash (ver upload_cache.py).
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to=import_upload_path)
+    filename = models.CharField(max_length=255) # Nombre con que se subió la primera vez
+    size = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.sha256[:12]})"
+
+class ImportJob(models.Model):
+    """
+    Importación de cartola en segundo plano (ver import_jobs.py). El archivo
+    queda guardado y los contadores se actualizan después de cada bloque, para
+    que el frontend muestre el avance y quede registro si algo falla.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', _('En cola')
+        RUNNING = 'RUNNING', _('Procesando')
+        DONE = 'DONE', _('Terminada')
+        FAILED = 'FAILED', _('Fallida')
+
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='import_jobs')
+    upload = models.ForeignKey(ImportUpload, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    file = models.FileField(upload_to='imports/')
+    filename = models.CharField(max_length=255) # Nombre original (define CSV/Excel)
+    mapping = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    claimed_by = models.CharField(max_length=50, blank=True) # Quién lo procesa: el pool del scheduler o un comando (import_files)
+
+    rows_processed = models.PositiveIntegerField(default=0)
+    imported = models.PositiveIntegerField(default=0)
+    duplicated = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True) # Muestra de filas con error [{row, error, values}]
+    error_message = models.TextField(blank=True) # Error que detuvo el job completo
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Los workers buscan los pendientes en orden de llegada
+            models.Index(fields=['status', 'created_at'], name='importjob_status_created'),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} -> {self.account} ({self.get_status_display()})"
+
+class ImportProfile(models.Model):
+    """
+    Mapeo de columnas guardado para un formato de cartola en una cuenta. El formato
+    se reconoce por la huella del header (nombres de columna + delimitador), así
+    que las cartolas siguientes del mismo banco se importan sin elegir columnas.
+    """
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='import_profiles')
+    fingerprint = models.CharField(max_length=64)
+    delimiter = models.CharField(max_length=1, blank=True) # Vacío para Excel
+    columns = models.JSONField(default=list) # Header tal como se vio (para mostrarlo)
+    mapping = models.JSONField(default=dict) # Incluye header_row
+    name = models.CharField(max_length=100, blank=True) # Ej: nombre del primer archivo importado
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('account', 'fingerprint')
+
+    def __str__(self):
+        return f"{self.name or self.fingerprint[:12]} ({self.account})"
     
 class EmailSource(models.Model):
     """
@@ -0,0 +1,122 @@
+"""
+Paginación de transacciones.
+
+Por defecto se mantiene la paginación numerada (con COUNT) que usa la vista
+actual. Con ?cursor= (o ?pagination=cursor para la primera página) se usa
+paginación por llave (keyset) sobre (-date, -id): cada página cuesta lo mismo
+sin importar qué tan profunda sea, y las transacciones nuevas que entran por
+la sincronización no mueven los límites de las páginas ya vistas.
+"""
+import base64
+import binascii
+import json
+from datetime import date
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor opaco con la (fecha, id) del borde de la página."""
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    invalid_cursor_message = 'Cursor inválido'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, row, reverse):
+        payload = json.dumps({'d': row.date.isoformat(), 'i': row.pk, 'r': int(reverse)})
+        token = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+            return date.fromisoformat(payload['d']), int(payload['i']), bool(payload['r'])
+        except (binascii.Error, UnicodeDecodeError, ValueError, KeyError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+
+        # El índice (-date, -id) sirve en ambos sentidos.
+        # date__lte acota el rango del índice y el OR desempata por id dentro del mismo día
+        if cursor is None:
+            reverse = False
+            queryset = queryset.order_by('-date', '-id')
+        else:
+            edge_date, edge_id, reverse = cursor
+            if reverse:
+                queryset = queryset.filter(
+                    Q(date__gte=edge_date) & (Q(date__gt=edge_date) | Q(id__gt=edge_id))
+                ).order_by('date', 'id')
+            else:
+                queryset = queryset.filter(
+                    Q(date__lte=edge_date) & (Q(date__lt=edge_date) | Q(id__lt=edge_id))
+                ).order_by('-date', '-id')
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        # Hacia atrás: siempre hay "siguiente" (venimos de ahí); "anterior" sólo si quedaron filas.
+        # Hacia adelante: "anterior" existe si llegamos con un cursor.
+        has_next = (not reverse and has_more) or (reverse and cursor is not None)
+        has_previous = (reverse and has_more) or (not reverse and cursor is not None)
+        self.next_link = self.encode_cursor(rows[-1], reverse=False) if rows and has_next else None
+        self.previous_link = self.encode_cursor(rows[0], reverse=True) if rows and has_previous else None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.next_link,
+            'previous': self.previous_link,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class TransactionPagination(PageNumberPagination):
+    """Numerada por defecto (compatible con el frontend actual); keyset con ?cursor= o ?pagination=cursor."""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        use_keyset = (
+            KeysetPagination.cursor_query_param in request.query_params
+            or request.query_params.get('pagination') == 'cursor'
+        )
+        self.keyset = KeysetPagination() if use_keyset else None
+        if self.keyset:
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,165 @@
+"""
+Matcher de Payees compilado en memoria.
+
+Las reglas literales (contiene, empieza con, exacto) se compilan en un
+autómata Aho-Corasick: una sola pasada por el texto sin importar cuántas
+reglas haya. Los anclajes se resuelven con centinelas al inicio/fin del texto.
+Las reglas regex se unen en una sola alternancia con un grupo por regla, así
+que basta un re.search para saber cuál coincidió.
+
+Se construye una vez por proceso y se reconstruye cuando cambia la "versión"
+guardada en el cache compartido, que se renueva al guardar/borrar un Payee o
+PayeeMatch.
+
+Precedencia determinista: exacto > empieza con > regex > contiene. Entre
+literales del mismo tipo gana el patrón más largo; a igual largo (y entre
+regex que coinciden en la misma posición) gana la regla más antigua (menor id).
+"""
+import re
+import threading
+import uuid
+from collections import deque
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import PayeeMatch
+from .validators import regex_problem
+
+VERSION_KEY = 'payee_matcher:version'
+
+# Centinelas que no aparecen en textos bancarios (se eliminan del texto antes de buscar)
+START, END = '\x02', '\x03'
+MatchType = PayeeMatch.MatchType
+TYPE_RANK = {MatchType.CONTAINS: 0, MatchType.REGEX: 1, MatchType.PREFIX: 2, MatchType.EXACT: 3}
+
+_lock = threading.Lock()
+_compiled = {'version': None, 'matcher': None}
+
+
+class AhoCorasick:
+    """Autómata sobre patrones en minúsculas. Cada patrón lleva una prioridad (mayor gana)."""
+
+    def __init__(self, patterns):
+        # patterns: [(texto, prioridad, valor)]
+        self.goto = [{}]
+        self.fail = [0]
+        self.best = [None]  # (prioridad, valor) del mejor patrón que termina en este estado o sus sufijos
+
+        for text, priority, value in patterns:
+            state = 0
+            for char in text:
+                nxt = self.goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][char] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.best.append(None)
+                state = nxt
+            if self.best[state] is None or priority > self.best[state][0]:
+                self.best[state] = (priority, value)
+
+        # Enlaces de falla por BFS; best hereda lo del sufijo más largo
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(char, 0)
+                inherited = self.best[self.fail[nxt]]
+                if inherited and (self.best[nxt] is None or inherited[0] > self.best[nxt][0]):
+                    self.best[nxt] = inherited
+
+    def search(self, text):
+        """(prioridad, valor) del patrón de mayor prioridad contenido en text, o None."""
+        state, found = 0, None
+        for char in text:
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            candidate = self.best[state]
+            if candidate and (found is None or candidate[0] > found[0]):
+                found = candidate
+        return found
+
+
+def _literal_key(rule):
+    pattern = rule.pattern.lower()
+    if rule.match_type == MatchType.PREFIX:
+        return START + pattern
+    if rule.match_type == MatchType.EXACT:
+        return START + pattern + END
+    return pattern
+
+
+class PayeeMatcher:
+    def __init__(self, rules):
+        # rules: PayeeMatch con payee (y su categoría por defecto) ya cargados, ordenadas por id
+        literals, alternatives, self.regex_payees = [], [], {}
+        for rule in rules:
+            if not rule.pattern:
+                continue
+            if rule.match_type == MatchType.REGEX:
+                # Reglas guardadas antes de la validación (o por fuera del ORM) se ignoran
+                if regex_problem(rule.pattern):
+                    continue
+                name = f"r{rule.id}"
+                alternatives.append(f"(?P<{name}>{rule.pattern})")
+                self.regex_payees[name] = rule.payee
+            else:
+                priority = (TYPE_RANK[rule.match_type], len(rule.pattern), -rule.id)
+                literals.append((_literal_key(rule), priority, rule.payee))
+
+        self.automaton = AhoCorasick(literals)
+        self.regex = re.compile("|".join(alternatives), re.IGNORECASE) if alternatives else None
+
+    def match(self, text):
+        text = (text or "").replace(START, "").replace(END, "").strip()
+        found = self.automaton.search(START + text.lower() + END)
+        if found and found[0][0] > TYPE_RANK[MatchType.REGEX]:
+            return found[1]
+        if self.regex:
+            hit = self.regex.search(text)
+            if hit:
+                return self.regex_payees[hit.lastgroup]
+        return found[1] if found else None
+
+    def match_many(self, texts):
+        return [self.match(text) for text in texts]
+
+
+def _current_version():
+    # Si el cache se limpió, una versión nueva obliga a todos los procesos a reconstruir
+    return cache.get_or_set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def get_payee_matcher():
+    """Matcher compilado para la versión vigente de las reglas (1 lectura de cache por llamada)."""
+    version = _current_version()
+    if _compiled['version'] == version:
+        return _compiled['matcher']
+
+    with _lock:
+        if _compiled['version'] != version:
+            rules = PayeeMatch.objects.select_related('payee__default_category').order_by('id')
+            _compiled['matcher'] = PayeeMatcher(rules)
+            _compiled['version'] = version
+    return _compiled['matcher']
+
+
+def bump_payee_matcher_version():
+    """
+    Invalida el matcher en todos los procesos. Se repite al hacer commit para que
+    nadie compile (y se quede con) las reglas previas a la transacción.
+    """
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, uuid.uuid4().hex, None))
+
+
+def match_payees(texts):
+    """Payee (o None) para cada texto, compilando las reglas a lo más una vez."""
+    return get_payee_matcher().match_many(texts)
@@ -0,0 +1,100 @@
+"""
+Aplicación retroactiva de las reglas de Payee.
+
+Recorre las transacciones sin payee o sin categoría en lotes por id (keyset),
+resuelve el payee en memoria con el matcher compilado y la categoría con la
+categoría por defecto del payee. Cada lote se escribe con un bulk_update y los
+saldos/rollups/hechos de gasto se ajustan una vez por lote. Sólo completa
+campos vacíos: nunca cambia un payee o una categoría ya puestos.
+"""
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import Q
+
+from .ledger import bulk_update_transaction_rows
+from .models import Transaction, Payee, Category
+from .payee_matcher import get_payee_matcher
+
+BATCH_SIZE = 1000
+PREVIEW_LIMIT = 50
+
+
+@dataclass
+class RuleRunResult:
+    total: int = 0
+    scanned: int = 0
+    changed: int = 0
+    payees_set: int = 0
+    categories_set: int = 0
+    dry_run: bool = False
+    # Primeros cambios (para mostrar antes de aplicar)
+    preview: list = field(default_factory=list)
+
+
+def pending_transactions():
+    """Transacciones que alguna regla podría completar (las transferencias no llevan payee ni categoría)."""
+    return Transaction.objects.filter(
+        Q(payee__isnull=True) | Q(category__isnull=True),
+        transfer_transaction__isnull=True
+    )
+
+
+def apply_payee_rules(dry_run=False, batch_size=BATCH_SIZE, queryset=None, progress=None):
+    """
+    Aplica las reglas actuales a las transacciones pendientes.
+    progress(result) se llama después de cada lote.
+    """
+    matcher = get_payee_matcher()
+    default_categories = dict(Payee.objects.exclude(default_category=None).values_list('id', 'default_category_id'))
+    payee_names = dict(Payee.objects.values_list('id', 'name'))
+    category_names = dict(Category.objects.values_list('id', 'name'))
+
+    pending = queryset if queryset is not None else pending_transactions()
+    result = RuleRunResult(total=pending.count(), dry_run=dry_run)
+    last_id = 0
+
+    while True:
+        with transaction.atomic():
+            batch = pending.filter(id__gt=last_id).order_by('id').only('id', 'date', 'raw_payee', 'payee', 'category')
+            if not dry_run:
+                batch = batch.select_for_update(of=('self',))
+            rows = list(batch[:batch_size])
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            changed = []
+            for tx in rows:
+                payee_id = tx.payee_id
+                if payee_id is None:
+                    matched = matcher.match(tx.raw_payee)
+                    payee_id = matched.id if matched else None
+                category_id = tx.category_id or default_categories.get(payee_id)
+                if (payee_id, category_id) == (tx.payee_id, tx.category_id):
+                    continue
+
+                result.payees_set += payee_id != tx.payee_id
+                result.categories_set += category_id != tx.category_id
+                if len(result.preview) < PREVIEW_LIMIT:
+                    result.preview.append({
+                        "id": tx.id,
+                        "date": tx.date,
+                        "raw_payee": tx.raw_payee,
+                        "payee": payee_names.get(payee_id),
+                        "category": category_names.get(category_id),
+                        "sets_payee": payee_id != tx.payee_id,
+                        "sets_category": category_id != tx.category_id,
+                    })
+                tx.payee_id, tx.category_id = payee_id, category_id
+                changed.append(tx)
+
+            if changed and not dry_run:
+                bulk_update_transaction_rows(changed, ['payee', 'category'])
+
+        result.scanned += len(rows)
+        result.changed += len(changed)
+        if progress:
+            progress(result)
+
+    return result
@@ -0,0 +1,51 @@
+"""
+Búsqueda de transacciones.
+
+Texto completo (tsvector generado + índice GIN) sobre raw_payee y memo, más
+similitud por trigramas (pg_trgm) para tolerar errores de tipeo. Si la base
+no tiene pg_trgm, cae a texto completo + icontains sobre raw_payee.
+"""
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import F, Q, FloatField
+from django.db.models.functions import Greatest
+
+from .models import Payee
+
+SEARCH_CONFIG = 'spanish'
+_trigram_by_database = {}
+
+
+def trigram_enabled():
+    """True si la extensión pg_trgm está instalada en la base actual (se consulta una vez)."""
+    name = connection.settings_dict['NAME']
+    if name not in _trigram_by_database:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_by_database[name] = cursor.fetchone() is not None
+    return _trigram_by_database[name]
+
+
+def search_transactions(queryset, term):
+    """Filtra por `term` y ordena por relevancia (luego por fecha)."""
+    term = term.strip()
+    if not term:
+        return queryset
+
+    query = SearchQuery(term, config=SEARCH_CONFIG, search_type='websearch')
+    rank = SearchRank(F('search_vector'), query)
+
+    if trigram_enabled():
+        # %> (word_similarity) usa los índices GIN gin_trgm_ops de raw_payee y memo
+        typo_match = Q(raw_payee__trigram_word_similar=term) | Q(memo__trigram_word_similar=term)
+        payees = Payee.objects.filter(name__trigram_word_similar=term)
+        rank = Greatest(rank, TrigramWordSimilarity(term, 'raw_payee'), output_field=FloatField())
+    else:
+        typo_match = Q(raw_payee__icontains=term)
+        payees = Payee.objects.filter(name__icontains=term)
+
+    return queryset.filter(
+        Q(search_vector=query) | typo_match | Q(payee_id__in=payees.values('id'))
+    ).annotate(
+        search_rank=rank
+    ).order_by(F('search_rank').desc(nulls_last=True), '-date', '-id')
@@ -1,19 +1,5 @@
 from rest_framework import serializers
-from django.db.models import Sum
-from .models import Transaction, Account, Category, CategoryGroup, Payee, EmailSource, EmailRule
-
-class AccountSerializer(serializers.ModelSerializer):
-    # Campo calculado: No existe en la tabla, se genera al vuelo
-    current_balance = serializers.SerializerMethodField()
-
-    class Meta:
-        model = Account
-        fields = ['id', 'name', 'account_type', 'current_balance']
-
-    def get_current_balance(self, obj):
-        # Sumar todas las transacciones de esta cuenta
-        total = obj.transactions.aggregate(Sum('amount'))['amount__sum']
-        return total or 0
+from .models import Transaction, Account, Category, CategoryGroup, Payee, EmailSource, EmailRule, TransferCandidate, ImportJob, ImportProfile
 
 class CategoryGroupSerializer(serializers.ModelSerializer):
     class Meta:
@@ -90,6 +76,97 @@ class TransactionSerializer(serializers.ModelSerializer):
         
         return super().create(validated_data)
     
+class TransactionBulkFilterSerializer(serializers.Serializer):
+    account = serializers.PrimaryKeyRelatedField(queryset=Account.objects.all(), required=False)
+    category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), required=False)
+    payee = serializers.PrimaryKeyRelatedField(queryset=Payee.objects.all(), required=False)
+    uncategorized = serializers.BooleanField(required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if not data:
+            raise serializers.ValidationError("El filtro necesita al menos un criterio")
+        return data
+
+    @staticmethod
+    def to_lookups(data):
+        """Criterios validados -> kwargs para Transaction.objects.filter()."""
+        lookups = {}
+        for field in ('account', 'category', 'payee'):
+            if field in data:
+                lookups[field] = data[field]
+        if 'uncategorized' in data:
+            lookups['category__isnull'] = data['uncategorized']
+        if 'date_from' in data:
+            lookups['date__gte'] = data['date_from']
+        if 'date_to' in data:
+            lookups['date__lte'] = data['date_to']
+        return lookups
+
+class TransactionBulkPatchSerializer(serializers.Serializer):
+    category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), required=False, allow_null=True)
+    payee = serializers.PrimaryKeyRelatedField(queryset=Payee.objects.all(), required=False, allow_null=True)
+    date = serializers.DateField(required=False)
+    memo = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+    def validate(self, data):
+        if not data:
+            raise serializers.ValidationError("El patch no tiene cambios")
+        return data
+
+class TransactionBulkSerializer(serializers.Serializer):
+    """
+    Cuerpo de transactions/bulk/: qué transacciones (ids o filter) y qué hacer (patch o delete).
+    Ej: {"ids": [1, 2, 3], "patch": {"category": 7}} o {"filter": {"uncategorized": true}, "delete": true}
+    """
+    MAX_IDS = 5000
+
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False, max_length=MAX_IDS)
+    filter = TransactionBulkFilterSerializer(required=False)
+    patch = TransactionBulkPatchSerializer(required=False)
+    delete = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, data):
+        if ('ids' in data) == ('filter' in data):
+            raise serializers.ValidationError("Indica 'ids' o 'filter' (sólo uno)")
+        if ('patch' in data) == data['delete']:
+            raise serializers.ValidationError("Indica 'patch' o 'delete' (sólo uno)")
+        return data
+
+class TransferSideSerializer(serializers.ModelSerializer):
+    account_name = serializers.ReadOnlyField(source='account.name')
+
+    class Meta:
+        model = Transaction
+        fields = ['id', 'date', 'raw_payee', 'amount', 'account', 'account_name']
+
+class TransferCandidateSerializer(serializers.ModelSerializer):
+    outflow = TransferSideSerializer(read_only=True)
+    inflow = TransferSideSerializer(read_only=True)
+
+    class Meta:
+        model = TransferCandidate
+        fields = ['id', 'outflow', 'inflow', 'day_gap', 'status', 'created_at']
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    account_name = serializers.ReadOnlyField(source='account.name')
+    upload_hash = serializers.ReadOnlyField(source='upload.sha256')
+
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'account', 'account_name', 'filename', 'upload_hash', 'status',
+            'rows_processed', 'imported', 'duplicated', 'failed', 'errors', 'error_message',
+            'created_at', 'started_at', 'finished_at'
+        ]
+
+class ImportProfileSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportProfile
+        fields = ['id', 'account', 'name', 'fingerprint', 'delimiter', 'columns', 'mapping', 'created_at', 'last_used_at']
+        read_only_fields = ['account', 'fingerprint', 'delimiter', 'columns', 'created_at', 'last_used_at']
+
 class EmailSourceSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=False, allow_blank=True)
 
@@ -123,12 +200,9 @@ class EmailRuleSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 class AccountSerializer(serializers.ModelSerializer):
-    current_balance = serializers.SerializerMethodField()
+    # Saldo desnormalizado (lo mantiene el ledger), sin sumar transacciones por cada cuenta
+    current_balance = serializers.ReadOnlyField(source='balance')
 
     class Meta:
         model = Account
-        fields = ['id', 'name', 'account_type', 'current_balance', 'identifier', 'off_budget']
-
-    def get_current_balance(self, obj):
-        total = obj.transactions.aggregate(Sum('amount'))['amount__sum']
-        return total or 0
\ No newline at end of file
+        fields = ['id', 'name', 'account_type', 'current_balance', 'identifier', 'off_budget']
\ No newline at end of file
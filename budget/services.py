@@ -1,76 +1,103 @@
-from .models import Payee, PayeeMatch, Transaction, Account
+from django.db import transaction as db_transaction
+from django.db.models import Q
+from .models import Payee, PayeeMatch, Transaction, Account, normalize_payee_text
+from .payee_matcher import get_payee_matcher, match_payees
+from .ledger import bulk_create_transactions
 from decimal import Decimal
 
+BATCH_SIZE = 1000
+
 def find_payee_for_text(raw_text):
     """
     Busca en las reglas de PayeeMatch si alguna coincide con raw_text.
     Retorna el objeto Payee encontrado o None.
+    Usa el matcher compilado (ver payee_matcher.py): no consulta la BD por cada texto.
     """
-    # Convertimos a minúsculas para búsqueda insensible a mayúsculas
-    text_lower = raw_text.lower()
-    
-    # Obtenemos todas las reglas (Idealmente esto se cachea si son muchas)
-    matches = PayeeMatch.objects.select_related('payee').all()
-    
-    for match in matches:
-        # Búsqueda simple de subcadena (contains)
-        # Ej: si pattern es "Uber", matchea con "Uber Eats Trip..."
-        if match.pattern.lower() in text_lower:
-            return match.payee
-            
-    return None
+    return get_payee_matcher().match(raw_text)
 
 def create_transaction_from_dto(account, dto):
     """
     Crea la transacción con chequeo de duplicados robusto.
+    Retorna (transaction, created); (None, False) si el import_id ya existía.
+    """
+    return create_transactions_from_dtos(account, [dto])[0]
+
+def create_transactions_from_dtos(account, dtos, batch_size=BATCH_SIZE):
     """
-    # 1. CHECK FUERTE: Por import_id (Hash MD5)
-    if dto.import_id and Transaction.objects.filter(import_id=dto.import_id).exists():
-        return None, False
+    Versión por lotes de create_transaction_from_dto para una cuenta.
+    Retorna un (transaction, created) por DTO, en el mismo orden y con la misma
+    clasificación que si se procesaran uno a uno (también entre DTOs del mismo lote).
+    """
+    results = []
+    for start in range(0, len(dtos), batch_size):
+        with db_transaction.atomic():
+            results.extend(_create_batch(account, dtos[start:start + batch_size]))
+    return results
+
+def _content_key(tx_date, amount, payee_key):
+    # Duplicado por contenido: misma cuenta, fecha, monto y payee normalizado (índice transaction_content_key)
+    return tx_date, amount, payee_key
+
+def _create_batch(account, dtos):
+    import_ids = {dto.import_id for dto in dtos if dto.import_id}
+    payee_keys = [normalize_payee_text(dto.payee) for dto in dtos]
+
+    # 1. Una consulta: import_ids ya usados + candidatos a duplicado por contenido en esta cuenta
+    candidates = Transaction.objects.filter(
+        Q(import_id__in=import_ids)
+        | Q(account=account, date__in={dto.date for dto in dtos}, amount__in={dto.amount for dto in dtos},
+            payee_key__in=set(payee_keys))
+    ).order_by('id')
+
+    known_import_ids = set()
+    by_content = {}
+    for tx in candidates:
+        if tx.import_id:
+            known_import_ids.add(tx.import_id)
+        if tx.account_id == account.id:
+            by_content.setdefault(_content_key(tx.date, tx.amount, tx.payee_key), tx)
+
+    # 2. Clasificar en memoria (en orden, para que los DTOs del lote se vean entre sí)
+    results, new_rows, backfill = [], [], {}
+    for dto, payee_key in zip(dtos, payee_keys):
+        if dto.import_id and dto.import_id in known_import_ids:
+            results.append((None, False))
+            continue
 
-    # 2. CHECK DE CONTENIDO (Para datos legacy o manuales sin ID)
-    # Buscamos si ya existe algo idéntico en esa cuenta, fecha y monto.
-    # Opcional: comparar también raw_payee, pero a veces los espacios varían.
-    # Siendo conservadores: Si fecha, monto y cuenta coinciden, Y el payee se parece, es duplicado.
-    
-    potential_dupes = Transaction.objects.filter(
-        account=account,
-        date=dto.date,
-        amount=dto.amount
-    )
+        key = _content_key(dto.date, dto.amount, payee_key)
+        existing = by_content.get(key)
+        if existing is not None:
+            # ACTUALIZACIÓN INTELIGENTE: la próxima vez el chequeo por import_id la atrapa rápido
+            if not existing.import_id and dto.import_id:
+                existing.import_id = dto.import_id
+                known_import_ids.add(dto.import_id)
+                if existing.pk:
+                    backfill[existing.pk] = existing
+            results.append((existing, False))
+            continue
 
-    for tx in potential_dupes:
-        # Comparamos el texto del Payee (limpiando espacios y mayúsculas)
-        db_payee = (tx.raw_payee or "").strip().lower()
-        dto_payee = (dto.payee or "").strip().lower()
-        
-        # Si los textos son iguales o muy similares, asumimos duplicado
-        if db_payee == dto_payee:
-            # ACTUALIZACIÓN INTELIGENTE:
-            # Si la transacción existente no tenía import_id, se lo ponemos ahora
-            # para que la próxima vez el Check 1 la atrape rápido.
-            if not tx.import_id and dto.import_id:
-                tx.import_id = dto.import_id
-                tx.save(update_fields=['import_id'])
-            
-            return tx, False # Encontrado, no creado
+        tx = Transaction(
+            account=account,
+            date=dto.date,
+            raw_payee=dto.payee,
+            amount=dto.amount,
+            memo=dto.memo,
+            import_id=dto.import_id
+        )
+        by_content[key] = tx
+        if dto.import_id:
+            known_import_ids.add(dto.import_id)
+        new_rows.append(tx)
+        results.append((tx, True))
 
-    # ... (Resto de la lógica de Payee Match igual que antes) ...
-    matched_payee = find_payee_for_text(dto.payee)
-    
-    assigned_category = None
-    if matched_payee and matched_payee.default_category:
-        assigned_category = matched_payee.default_category
+    # 3. Payees en memoria con el matcher compilado
+    for tx, payee in zip(new_rows, match_payees([tx.raw_payee for tx in new_rows])):
+        tx.payee = payee
+        tx.category = payee.default_category if payee else None
 
-    transaction = Transaction.objects.create(
-        account=account,
-        date=dto.date,
-        raw_payee=dto.payee,
-        payee=matched_payee,
-        category=assigned_category,
-        amount=dto.amount,
-        memo=dto.memo,
-        import_id=dto.import_id
-    )
-    
-    return transaction, True
\ No newline at end of file
+    # 4. Un INSERT por lote (los saldos/rollups se ajustan una vez) y un UPDATE para los import_id
+    if new_rows:
+        bulk_create_transactions(new_rows)
+    if backfill:
+        Transaction.objects.bulk_update(list(backfill.values()), ['import_id'])
+    return results
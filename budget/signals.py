@@ -1,6 +1,13 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save, pre_delete, post_delete
+from django.db.models import QuerySet
 from django.dispatch import receiver
-from .models import Account, Category, CategoryGroup
+from .models import Account, Category, CategoryGroup, Transaction, BudgetAssignment, Payee, PayeeMatch
+from .ledger import (
+    capture_transaction_states, apply_transaction_changes, apply_assignment_change,
+    detach_payee_spending, in_ledger_batch
+)
+from .summary_cache import invalidate_summary_cache
+from .payee_matcher import bump_payee_matcher_version
 
 @receiver(post_save, sender=Account)
 def create_credit_card_category(sender, instance, created, **kwargs):
@@ -20,4 +27,119 @@ def create_credit_card_category(sender, instance, created, **kwargs):
             defaults={'is_active': True}
         )
 
-        Account.objects.filter(pk=instance.pk).update(payment_category=category)
\ No newline at end of file
+        Account.objects.filter(pk=instance.pk).update(payment_category=category)
+
+def _deleting_budget_structure(origin):
+    """True si el borrado viene en cascada desde una categoría o grupo (sus rollups se van con ella)."""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model in (Category, CategoryGroup)
+
+# --- ROLLUPS: TRANSACCIONES ---
+# Dentro de ledger_batch() el que abre el bloque aplica los deltas del lote completo.
+
+@receiver(pre_save, sender=Transaction)
+def capture_transaction_before_save(sender, instance, raw=False, **kwargs):
+    instance._ledger_before = {} if raw or in_ledger_batch() else capture_transaction_states([instance.pk])
+
+@receiver(post_save, sender=Transaction)
+def apply_transaction_save(sender, instance, raw=False, **kwargs):
+    if raw or in_ledger_batch():
+        return
+    before = getattr(instance, '_ledger_before', {})
+    after = capture_transaction_states([instance.pk])
+    apply_transaction_changes(before, after)
+
+@receiver(pre_delete, sender=Transaction)
+def capture_transaction_before_delete(sender, instance, **kwargs):
+    if in_ledger_batch():
+        return
+    # Incluye las transferencias vinculadas: quedarán desvinculadas (SET_NULL)
+    instance._ledger_before = capture_transaction_states([instance.pk])
+
+@receiver(post_delete, sender=Transaction)
+def apply_transaction_delete(sender, instance, **kwargs):
+    if in_ledger_batch():
+        return
+    before = getattr(instance, '_ledger_before', {})
+    after = capture_transaction_states([pk for pk in before if pk != instance.pk], include_linked=False)
+    # Las vinculadas que también se borraron en este mismo lote se procesan en su propia señal
+    before = {pk: state for pk, state in before.items() if pk == instance.pk or pk in after}
+    apply_transaction_changes(before, after)
+
+# --- ROLLUPS: ASIGNACIONES ---
+
+def _assignment_state(pk):
+    return BudgetAssignment.objects.filter(pk=pk).values_list('category_id', 'month', 'amount').first() if pk else None
+
+@receiver(pre_save, sender=BudgetAssignment)
+def capture_assignment_before_save(sender, instance, raw=False, **kwargs):
+    instance._ledger_before = None if raw else _assignment_state(instance.pk)
+
+@receiver(post_save, sender=BudgetAssignment)
+def apply_assignment_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    apply_assignment_change(
+        getattr(instance, '_ledger_before', None),
+        (instance.category_id, instance.month, instance.amount)
+    )
+
+@receiver(post_delete, sender=BudgetAssignment)
+def apply_assignment_delete(sender, instance, origin=None, **kwargs):
+    if origin is not None and _deleting_budget_structure(origin):
+        return
+    apply_assignment_change((instance.category_id, instance.month, instance.amount), None)
+
+# --- ROLLUPS: CAMBIO DE OFF-BUDGET ---
+# Las transferencias hacia una cuenta Off-Budget cuentan como gasto,
+# así que cambiar el flag altera la actividad de las transacciones que apuntan a ella.
+
+def _transfers_into(account_pk):
+    return Transaction.objects.filter(transfer_transaction__account_id=account_pk)
+
+@receiver(pre_save, sender=Account)
+def capture_account_before_save(sender, instance, raw=False, **kwargs):
+    instance._ledger_before = None
+    if raw or not instance.pk:
+        return
+    old_off_budget = Account.objects.filter(pk=instance.pk).values_list('off_budget', flat=True).first()
+    if old_off_budget is not None and old_off_budget != instance.off_budget:
+        instance._ledger_before = capture_transaction_states(queryset=_transfers_into(instance.pk))
+
+@receiver(post_save, sender=Account)
+def apply_account_off_budget_change(sender, instance, raw=False, **kwargs):
+    before = getattr(instance, '_ledger_before', None)
+    if raw or before is None:
+        return
+    apply_transaction_changes(before, capture_transaction_states(queryset=_transfers_into(instance.pk)))
+
+# --- HECHOS DE GASTO: BORRADO DE PAYEE ---
+# Las transacciones quedan con payee NULL vía SET_NULL, que no dispara señales por transacción.
+
+@receiver(pre_delete, sender=Payee)
+def detach_deleted_payee_spending(sender, instance, **kwargs):
+    detach_payee_spending(instance.pk)
+
+# --- CACHE DEL RESUMEN ---
+# Cambios de estructura (nombres, orden, metas, tipo de cuenta) afectan todos los meses.
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=CategoryGroup)
+@receiver(post_delete, sender=CategoryGroup)
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def invalidate_summary_on_structure_change(sender, raw=False, **kwargs):
+    if not raw:
+        invalidate_summary_cache()
+
+# --- MATCHER DE PAYEES ---
+# Cualquier cambio en reglas o payees (nombre, categoría por defecto) invalida el matcher compilado.
+
+@receiver(post_save, sender=PayeeMatch)
+@receiver(post_delete, sender=PayeeMatch)
+@receiver(post_save, sender=Payee)
+@receiver(post_delete, sender=Payee)
+def invalidate_payee_matcher(sender, raw=False, **kwargs):
+    if not raw:
+        bump_payee_matcher_version()
@@ -0,0 +1,52 @@
+"""
+Reporte de gastos ("cubo") sobre la tabla de hechos SpendingFact.
+
+Los hechos ya vienen agregados por (mes, categoría, payee, cuenta), así que
+cualquier combinación de dimensiones y drilldown es un GROUP BY sobre una
+tabla chica, sin volver a recorrer Transaction.
+"""
+from django.db.models import Sum
+
+from .models import SpendingFact
+
+# dimensión -> (campo id, campo nombre) en SpendingFact
+DIMENSIONS = {
+    'group': ('category__group_id', 'category__group__name'),
+    'category': ('category_id', 'category__name'),
+    'payee': ('payee_id', 'payee__name'),
+    'account': ('account_id', 'account__name'),
+    'month': ('month', None),
+}
+NO_PAYEE_LABEL = "(Sin beneficiario)"
+
+
+def spending_cube(from_month, to_month, dimensions, filters=None):
+    """
+    Gasto (positivo) por combinación de dimensiones entre from_month y to_month (inclusive).
+    filters: {dimensión: id} para hacer drilldown (ej: {'group': 3}).
+    Retorna filas {<dim>_id, <dim>, ..., name, value} ordenadas de mayor a menor gasto.
+    """
+    facts = SpendingFact.objects.filter(month__gte=from_month, month__lte=to_month, outflow__lt=0)
+    for dim, value in (filters or {}).items():
+        facts = facts.filter(**{DIMENSIONS[dim][0]: value})
+
+    fields = [f for dim in dimensions for f in DIMENSIONS[dim] if f]
+    rows = facts.values(*fields).annotate(total=Sum('outflow')).order_by('total', *fields)
+
+    result = []
+    for row in rows:
+        item, labels = {}, []
+        for dim in dimensions:
+            id_field, name_field = DIMENSIONS[dim]
+            if name_field is None:
+                label = row[id_field].strftime('%Y-%m')
+                item[dim] = label
+            else:
+                label = row[name_field] or NO_PAYEE_LABEL
+                item[f"{dim}_id"] = row[id_field]
+                item[dim] = label
+            labels.append(label)
+        item["name"] = " / ".join(labels)
+        item["value"] = abs(row['total']) # Positivo para el gráfico de torta
+        result.append(item)
+    return result
@@ -0,0 +1,118 @@
+"""
+Cache del resumen mensual del presupuesto (BudgetSummaryView).
+
+Como el disponible se arrastra mes a mes, un cambio en el mes M sólo invalida
+M y los meses posteriores. El RTA no se cachea: es global (no depende del mes)
+y se calcula aparte.
+
+No hay índice de meses cacheados: el cache es un FileBasedCache compartido
+entre procesos y un índice (leer, agregar, guardar) pierde entradas cuando dos
+procesos lo escriben a la vez. En cambio, la llave de cada mes incluye tres
+tokens (global, del año y del mes). Invalidar desde M escribe tokens nuevos
+para M y los meses que le quedan al año, y para los años siguientes; las
+entradas anteriores quedan inalcanzables y expiran solas. Los tokens son
+aleatorios, así que escribirlos no depende de leerlos antes.
+
+Los contadores de hits/misses/invalidaciones son aproximados: en FileBasedCache
+incr es leer y escribir el archivo, y dos procesos a la vez pueden perder un
+incremento. Sirven para ver la tasa de aciertos, no para contar exacto.
+"""
+import uuid
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+KEY_PREFIX = 'budget_summary'
+GENERATION_KEY = f'{KEY_PREFIX}:generation'
+FAR_YEARS_KEY = f'{KEY_PREFIX}:year:far'
+STATS_KEYS = ('hits', 'misses', 'invalidations')
+
+def _new_token():
+    return uuid.uuid4().hex[:12]
+
+def _year_key(year, today=None):
+    # Los años después del siguiente comparten un token: así invalidar nunca recorre años sin fin
+    if year > (today or date.today()).year + 1:
+        return FAR_YEARS_KEY
+    return f'{KEY_PREFIX}:year:{year}'
+
+def _month_token_key(month_start):
+    return f'{KEY_PREFIX}:version:{month_start.isoformat()}'
+
+def _tokens(month_start):
+    """Tokens (global, año, mes) vigentes para el mes; crea los que falten."""
+    keys = [GENERATION_KEY, _year_key(month_start.year), _month_token_key(month_start)]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    for key in missing:
+        cache.add(key, _new_token(), None)
+    if missing:
+        # Si otro proceso lo creó primero, vale el suyo
+        found.update(cache.get_many(missing))
+    return [found.get(key, '') for key in keys]
+
+def _month_key(month_start):
+    return f'{KEY_PREFIX}:month:{month_start.isoformat()}:' + '.'.join(_tokens(month_start))
+
+def _incr(name, delta=1):
+    # Aproximado: incr no es atómico en FileBasedCache (ver docstring del módulo)
+    key = f'{KEY_PREFIX}:stats:{name}'
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # La llave expiró/se borró entre el add y el incr
+        cache.set(key, delta, None)
+
+def get_cached_summary(month_start, compute):
+    """
+    Retorna (payload, hit). Si el mes no está en cache lo calcula con compute(month_start).
+    """
+    # La llave se arma antes de calcular: si se invalida mientras calculamos, el
+    # resultado queda guardado bajo tokens viejos y nadie lo vuelve a leer.
+    key = _month_key(month_start)
+    payload = cache.get(key)
+    if payload is not None:
+        _incr('hits')
+        return payload, True
+
+    _incr('misses')
+    payload = compute(month_start)
+    timeout = getattr(settings, 'BUDGET_SUMMARY_CACHE_TIMEOUT', 60 * 60 * 24)
+    cache.set(key, payload, timeout)
+    return payload, False
+
+def _rotate_tokens(from_month):
+    if from_month is None:
+        keys = [GENERATION_KEY]
+    else:
+        today = date.today()
+        keys = [_month_token_key(from_month.replace(month=m)) for m in range(from_month.month, 13)]
+        keys += [_year_key(year, today) for year in range(from_month.year + 1, today.year + 2)]
+        keys.append(FAR_YEARS_KEY)
+    cache.set_many({key: _new_token() for key in keys}, None)
+    _incr('invalidations')
+
+def invalidate_summary_cache(from_month=None):
+    """
+    Invalida el mes de from_month y todos los posteriores (todos si es None).
+    Se repite al hacer commit para que una lectura concurrente no deje en cache
+    datos previos a la transacción.
+    """
+    from_month = from_month.replace(day=1) if from_month else None
+    _rotate_tokens(from_month)
+    transaction.on_commit(lambda: _rotate_tokens(from_month))
+
+def is_summary_cached(month_start):
+    return cache.has_key(_month_key(month_start.replace(day=1)))
+
+def summary_cache_stats():
+    stats = {name: cache.get(f'{KEY_PREFIX}:stats:{name}', 0) for name in STATS_KEYS}
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0
+    return stats
+
+def reset_summary_cache_stats():
+    cache.delete_many([f'{KEY_PREFIX}:stats:{name}' for name in STATS_KEYS])
@@ -0,0 +1,364 @@
+from django.db.models import Sum, F, Case, When, Value, DecimalField, Window
+from django.db.models.functions import TruncMonth
+from django.db import transaction
+from collections import defaultdict
+from decimal import Decimal
+import math
+from .models import Transaction, Account, Category, CategoryGroup, BudgetAssignment, CategoryMonthRollup
+from .summary_cache import get_cached_summary
+from .ledger import next_month_start
+from .goal_engine import goal_status_grid
+
+# Cuentas líquidas que alimentan el "Listo para Asignar"
+LIQUID_ACCOUNT_TYPES = ['CHECKING', 'SAVINGS', 'CASH']
+
+def compute_ready_to_assign():
+    """RTA acumulativo: efectivo en cuentas on-budget menos todo lo asignado históricamente."""
+    total_cash = Account.objects.filter(
+        account_type__in=LIQUID_ACCOUNT_TYPES,
+        off_budget=False
+    ).aggregate(total=Sum('balance'))['total'] or 0
+
+    total_assigned_all_time = BudgetAssignment.objects.aggregate(Sum('amount'))['amount__sum'] or 0
+    return total_cash - total_assigned_all_time
+
+def load_budget_structure():
+    """Grupos activos y sus categorías activas, ya ordenados (2 consultas)."""
+    groups = list(CategoryGroup.objects.filter(is_active=True).order_by('order', 'name'))
+
+    categories_by_group = {group.id: [] for group in groups}
+    categories = Category.objects.filter(
+        is_active=True,
+        group__is_active=True
+    ).select_related('credit_account').order_by('order', 'name')
+    for cat in categories:
+        categories_by_group[cat.group_id].append(cat)
+
+    return groups, categories_by_group
+
+def compute_month_summary(target_month_start):
+    """
+    Calcula los grupos y totales del presupuesto de un mes para todas las categorías activas.
+    No incluye el RTA, que es global; así el resultado se puede cachear por mes.
+
+    En vez de consultar categoría por categoría, lee una fila de rollup por
+    categoría más un número fijo de consultas agrupadas para las tarjetas,
+    y arma la respuesta en Python.
+    """
+    next_month = next_month_start(target_month_start)
+
+    # --- 1. ROLLUPS: una fila por categoría (la última con mes <= al consultado) ---
+    # Si la fila es de este mes trae lo asignado y la actividad; si es anterior,
+    # sólo arrastra el disponible.
+    latest_rollups = CategoryMonthRollup.objects.filter(
+        month__lte=target_month_start
+    ).order_by('category_id', '-month').distinct('category_id')
+
+    assigned_month_map = {}
+    activity_month_map = {}
+    available_map = {}
+    for rollup in latest_rollups:
+        available_map[rollup.category_id] = rollup.available
+        if rollup.month == target_month_start:
+            assigned_month_map[rollup.category_id] = rollup.assigned
+            activity_month_map[rollup.category_id] = rollup.activity
+
+    # --- 2. DATOS TARJETAS ---
+    cc_spending_all_time = Transaction.objects.filter(
+        date__lt=next_month,
+        account__account_type=Account.Type.CREDIT_CARD,
+        transfer_transaction__isnull=True,
+        category__isnull=False
+    ).values('account').annotate(total_spent=Sum('amount'))
+
+    cc_spending_map = {e['account']: abs(e['total_spent']) for e in cc_spending_all_time}
+
+    cc_payments_all_time = Transaction.objects.filter(
+        date__lt=next_month,
+        account__account_type=Account.Type.CREDIT_CARD,
+        transfer_transaction__isnull=False,
+        amount__gt=0
+    ).values('account').annotate(total_paid=Sum('amount'))
+
+    cc_payment_map = {e['account']: e['total_paid'] for e in cc_payments_all_time}
+
+    # Pagos de tarjeta de ESTE mes (sin categoría, vinculados como transferencia)
+    cc_monthly_payments = Transaction.objects.filter(
+        category=None,
+        account__payment_category__isnull=False,
+        date__gte=target_month_start,
+        date__lt=next_month,
+        transfer_transaction__isnull=False,
+        amount__gt=0
+    ).values('account').annotate(total=Sum('amount'))
+
+    cc_monthly_payment_map = {e['account']: e['total'] for e in cc_monthly_payments}
+
+    # --- 3. ARMADO POR GRUPO ---
+    groups, categories_by_group = load_budget_structure()
+
+    total_assigned_month = 0
+    total_activity_month = 0
+    total_available = 0
+    grouped_data = []
+    evaluated = []  # (categoría, fila) para evaluar todas las metas de una pasada
+
+    for group in groups:
+        group_categories = []
+
+        for cat in categories_by_group[group.id]:
+            val_assigned_this_month = assigned_month_map.get(cat.id, 0)
+            val_activity_month = activity_month_map.get(cat.id, 0)
+
+            available_amount = available_map.get(cat.id, 0)
+
+            # Lógica TC: el disponible del sobre de pago es lo gastado menos lo pagado
+            if hasattr(cat, 'credit_account'):
+                card_id = cat.credit_account.id
+                funded = cc_spending_map.get(card_id, 0)
+                paid = cc_payment_map.get(card_id, 0)
+                available_amount = funded - paid
+
+                monthly_payments = cc_monthly_payment_map.get(card_id, 0)
+                if monthly_payments > 0:
+                    val_activity_month = -monthly_payments
+
+            total_assigned_month += val_assigned_this_month
+            total_activity_month += val_activity_month
+            total_available += available_amount
+
+            row = {
+                "category_id": cat.id,
+                "category_name": cat.name,
+                "assigned": val_assigned_this_month,
+                "activity": val_activity_month,
+                "available": available_amount,
+                "goal": None
+            }
+            group_categories.append(row)
+            evaluated.append((cat, row))
+
+        grouped_data.append({
+            "group_id": group.id,
+            "group_name": group.name,
+            "categories": group_categories
+        })
+
+    goals = goal_status_grid(
+        [cat for cat, _ in evaluated],
+        [[row["assigned"]] for _, row in evaluated],
+        [[row["available"]] for _, row in evaluated],
+        [target_month_start]
+    )
+    for (_, row), goal_row in zip(evaluated, goals):
+        row["goal"] = goal_row[0]
+
+    return {
+        "month": target_month_start.strftime('%Y-%m-%d'),
+        "groups": grouped_data,
+        "totals": {
+            "assigned": total_assigned_month,
+            "activity": total_activity_month,
+            "available": total_available
+        }
+    }
+
+def build_summary_payload(month_summary):
+    """Agrega el RTA (siempre fresco) al resumen mensual."""
+    return {
+        "month": month_summary["month"],
+        "ready_to_assign": compute_ready_to_assign(),
+        "groups": month_summary["groups"],
+        "totals": month_summary["totals"]
+    }
+
+def compute_budget_summary(target_month_start):
+    """Respuesta completa de BudgetSummaryView, sin pasar por el cache."""
+    return build_summary_payload(compute_month_summary(target_month_start))
+
+def get_budget_summary(target_month_start):
+    """Respuesta completa usando el cache por mes. Retorna (payload, cache_hit)."""
+    month_summary, hit = get_cached_summary(target_month_start, compute_month_summary)
+    return build_summary_payload(month_summary), hit
+
+
+def auto_fund_goals(target_month_start):
+    """
+    Asigna lo que le falta a cada meta no cumplida del mes, en el orden del
+    presupuesto, mientras alcance el RTA. Retorna (asignaciones, RTA restante).
+    """
+    month_summary = compute_month_summary(target_month_start)
+    remaining = compute_ready_to_assign()
+    funded = []
+
+    rows = [row for group in month_summary["groups"] for row in group["categories"]]
+    with transaction.atomic():
+        for row in rows:
+            goal = row["goal"]
+            if goal["type"] == Category.GoalType.NONE or goal["is_met"] or goal["required"] <= 0:
+                continue
+            if remaining <= 0:
+                break
+
+            # CLP no usa decimales: redondeamos la cuota hacia arriba
+            amount = min(Decimal(math.ceil(goal["required"])), remaining)
+            new_assigned = row["assigned"] + amount
+            BudgetAssignment.objects.update_or_create(
+                category_id=row["category_id"],
+                month=target_month_start,
+                defaults={'amount': new_assigned}
+            )
+            remaining -= amount
+            funded.append({
+                "category_id": row["category_id"],
+                "category_name": row["category_name"],
+                "added": amount,
+                "assigned": new_assigned
+            })
+
+    return funded, remaining
+
+def month_range(from_month, to_month):
+    months = []
+    current = from_month
+    while current <= to_month:
+        months.append(current)
+        current = next_month_start(current)
+    return months
+
+def compute_range_summary(from_month, to_month):
+    """
+    Asignado, actividad, disponible y meta por categoría para cada mes entre from_month y to_month.
+
+    El costo no depende de la cantidad de meses: los rollups ya traen el disponible
+    acumulado y las tarjetas se resuelven con una suma acumulada (ventana) por cuenta.
+    """
+    months = month_range(from_month, to_month)
+    range_end = next_month_start(to_month)
+
+    # --- 1. ROLLUPS DEL RANGO + ARRASTRE DESDE ANTES DEL RANGO ---
+    rollups_by_month = {}
+    for rollup in CategoryMonthRollup.objects.filter(month__gte=from_month, month__lte=to_month):
+        rollups_by_month[(rollup.category_id, rollup.month)] = rollup
+
+    carried_available = dict(
+        CategoryMonthRollup.objects.filter(month__lt=from_month)
+        .order_by('category_id', '-month').distinct('category_id')
+        .values_list('category_id', 'available')
+    )
+
+    # --- 2. TARJETAS: gasto y pagos acumulados por cuenta y mes (SUM ... OVER) ---
+    cc_rows = Transaction.objects.filter(
+        date__lt=range_end,
+        account__account_type=Account.Type.CREDIT_CARD
+    ).annotate(period=TruncMonth('date')).annotate(
+        spent=Window(
+            Sum(Case(
+                When(transfer_transaction__isnull=True, category__isnull=False, then=F('amount')),
+                default=Value(0), output_field=DecimalField()
+            )),
+            partition_by=[F('account_id')], order_by=F('period').asc()
+        ),
+        paid=Window(
+            Sum(Case(
+                When(transfer_transaction__isnull=False, amount__gt=0, then=F('amount')),
+                default=Value(0), output_field=DecimalField()
+            )),
+            partition_by=[F('account_id')], order_by=F('period').asc()
+        )
+    ).values('account_id', 'period', 'spent', 'paid').distinct().order_by('account_id', 'period')
+
+    cc_cumulative = defaultdict(list)  # account_id -> [(period, spent, paid)] ordenado
+    for row in cc_rows:
+        cc_cumulative[row['account_id']].append((row['period'], row['spent'], row['paid']))
+
+    cc_monthly_payment_map = {
+        (e['account'], e['period']): e['total'] for e in Transaction.objects.filter(
+            category=None,
+            account__payment_category__isnull=False,
+            date__gte=from_month,
+            date__lt=range_end,
+            transfer_transaction__isnull=False,
+            amount__gt=0
+        ).annotate(period=TruncMonth('date')).values('account', 'period').annotate(total=Sum('amount'))
+    }
+
+    # --- 3. ARMADO ---
+    groups, categories_by_group = load_budget_structure()
+
+    totals = {m: {"assigned": 0, "activity": 0, "available": 0} for m in months}
+    grouped_data = []
+    evaluated = []
+
+    for group in groups:
+        group_categories = []
+
+        for cat in categories_by_group[group.id]:
+            is_card = hasattr(cat, 'credit_account')
+            card_history = cc_cumulative.get(cat.credit_account.id, []) if is_card else []
+            card_idx = 0
+            card_spent, card_paid = 0, 0
+            available_amount = carried_available.get(cat.id, 0)
+            category_months = []
+
+            for month in months:
+                rollup = rollups_by_month.get((cat.id, month))
+                val_assigned = rollup.assigned if rollup else 0
+                val_activity = rollup.activity if rollup else 0
+                if rollup:
+                    available_amount = rollup.available
+                month_available = available_amount
+
+                if is_card:
+                    # Avanzamos por los meses con movimientos hasta el mes actual
+                    while card_idx < len(card_history) and card_history[card_idx][0] <= month:
+                        _, card_spent, card_paid = card_history[card_idx]
+                        card_idx += 1
+                    month_available = abs(card_spent) - card_paid
+
+                    monthly_payments = cc_monthly_payment_map.get((cat.credit_account.id, month), 0)
+                    if monthly_payments > 0:
+                        val_activity = -monthly_payments
+
+                totals[month]["assigned"] += val_assigned
+                totals[month]["activity"] += val_activity
+                totals[month]["available"] += month_available
+
+                category_months.append({
+                    "month": month.strftime('%Y-%m-%d'),
+                    "assigned": val_assigned,
+                    "activity": val_activity,
+                    "available": month_available
+                })
+
+            group_categories.append({
+                "category_id": cat.id,
+                "category_name": cat.name,
+                "months": category_months
+            })
+            evaluated.append((cat, category_months))
+
+        grouped_data.append({
+            "group_id": group.id,
+            "group_name": group.name,
+            "categories": group_categories
+        })
+
+    # Metas de todas las categorías y todos los meses en una sola pasada
+    goals = goal_status_grid(
+        [cat for cat, _ in evaluated],
+        [[cell["assigned"] for cell in cells] for _, cells in evaluated],
+        [[cell["available"] for cell in cells] for _, cells in evaluated],
+        months
+    )
+    for (_, cells), goal_row in zip(evaluated, goals):
+        for cell, goal in zip(cells, goal_row):
+            cell["goal"] = goal
+
+    return {
+        "from": from_month.strftime('%Y-%m-%d'),
+        "to": to_month.strftime('%Y-%m-%d'),
+        "months": [m.strftime('%Y-%m-%d') for m in months],
+        "groups": grouped_data,
+        "totals": [{"month": m.strftime('%Y-%m-%d'), **totals[m]} for m in months]
+    }
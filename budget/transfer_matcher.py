@@ -0,0 +1,169 @@
+"""
+Detección automática de transferencias entre cuentas propias.
+
+Una transferencia llega como dos importaciones sin relación: la salida
+("Transferencia a terceros") en una cuenta y la entrada ("Aviso de
+transferencia") en otra. Se buscan pares con montos opuestos, en cuentas
+distintas y con fechas dentro de una ventana, con un sort-merge sobre
+(abs(monto), fecha) en vez de comparar todas contra todas.
+
+Un par es seguro si cada lado tiene un único candidato y además parece
+transferencia: la descripción lo dice ("Transferencia", "Traspaso") o ninguno
+de los dos lados tiene categoría. Sólo esos se vinculan solos (vincular borra
+la categoría de ambos lados); los demás quedan como TransferCandidate
+pendientes para revisión manual.
+"""
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .ledger import bulk_update_transaction_rows
+from .models import Transaction, TransferCandidate, normalize_payee_text
+
+DEFAULT_WINDOW_DAYS = 3
+DEFAULT_LOOKBACK_DAYS = 90
+# Palabras (normalizadas) con que los bancos describen una transferencia
+TRANSFER_KEYWORDS = ('transf', 'traspaso')
+
+
+class TransferAlreadyLinked(Exception):
+    """Alguna de las transacciones ya está vinculada a otra transferencia."""
+
+
+def window_days_setting():
+    return getattr(settings, 'TRANSFER_MATCH_WINDOW_DAYS', DEFAULT_WINDOW_DAYS)
+
+
+def lookback_days_setting():
+    return getattr(settings, 'TRANSFER_MATCH_LOOKBACK_DAYS', DEFAULT_LOOKBACK_DAYS)
+
+
+@dataclass
+class TransferMatchResult:
+    scanned: int = 0
+    linked: list = field(default_factory=list) # [(salida, entrada)]
+    queued: int = 0
+    dry_run: bool = False
+
+
+def find_transfer_pairs(rows, window_days):
+    """
+    rows: iterable con id, account_id, date, amount.
+    Retorna [(id salida, id entrada, días de diferencia)] con montos opuestos,
+    cuentas distintas y fechas a lo más window_days de distancia.
+    """
+    outflows = sorted((-r.amount, r.date, r.id, r.account_id) for r in rows if r.amount < 0)
+    inflows = sorted((r.amount, r.date, r.id, r.account_id) for r in rows if r.amount > 0)
+    window = timedelta(days=window_days)
+
+    pairs = []
+    start = 0
+    for amount, day, out_id, out_account in outflows:
+        # Las salidas vienen ordenadas por (monto, fecha): el inicio de la ventana sólo avanza
+        while start < len(inflows) and inflows[start][:2] < (amount, day - window):
+            start += 1
+        end = start
+        while end < len(inflows) and inflows[end][:2] <= (amount, day + window):
+            _, in_day, in_id, in_account = inflows[end]
+            if in_account != out_account:
+                pairs.append((out_id, in_id, abs((in_day - day).days)))
+            end += 1
+    return pairs
+
+
+def looks_like_transfer(*rows):
+    """La descripción de algún lado nombra una transferencia, o ningún lado tiene categoría."""
+    if all(row.category_id is None for row in rows):
+        return True
+    return any(keyword in normalize_payee_text(row.raw_payee) for row in rows for keyword in TRANSFER_KEYWORDS)
+
+
+def split_confident(pairs, rows_by_id):
+    """
+    (seguros, ambiguos): seguro = ni la salida ni la entrada tienen otro candidato
+    y el par parece transferencia (ver looks_like_transfer).
+    """
+    per_outflow = Counter(out_id for out_id, _, _ in pairs)
+    per_inflow = Counter(in_id for _, in_id, _ in pairs)
+    confident, ambiguous = [], []
+    for pair in pairs:
+        unique = per_outflow[pair[0]] == 1 and per_inflow[pair[1]] == 1
+        safe = unique and looks_like_transfer(rows_by_id[pair[0]], rows_by_id[pair[1]])
+        (confident if safe else ambiguous).append(pair)
+    return confident, ambiguous
+
+
+def link_transfer_pairs(pairs):
+    """
+    Vincula cada par (id, id) como transferencia con un solo bulk_update;
+    los saldos/rollups se ajustan una vez para todo el lote.
+    TransferAlreadyLinked si algún lado ya tiene vínculo (revisado con las filas bloqueadas).
+    """
+    ids = [pk for pair in pairs for pk in pair]
+    with transaction.atomic():
+        txs = Transaction.objects.select_for_update(of=('self',)).select_related('account').in_bulk(ids)
+        linked_to = Transaction.objects.filter(transfer_transaction_id__in=ids).exists()
+        if linked_to or any(tx.transfer_transaction_id for tx in txs.values()):
+            raise TransferAlreadyLinked("Una de las transacciones ya está vinculada a otra transferencia")
+        rows = []
+        for first_id, second_id in pairs:
+            first, second = txs[first_id], txs[second_id]
+            first.transfer_transaction_id = second.pk
+            second.transfer_transaction_id = first.pk
+            # Sólo se borra la categoría si AMBAS cuentas son On-Budget. Si una es Off-Budget,
+            # la transferencia es un gasto/ingreso real y el usuario le asigna categoría.
+            if not first.account.off_budget and not second.account.off_budget:
+                first.category_id = second.category_id = None
+            rows += [first, second]
+        bulk_update_transaction_rows(rows, ['transfer_transaction', 'category'])
+        # Los candidatos pendientes de estas transacciones ya no aplican
+        TransferCandidate.objects.filter(
+            Q(outflow_id__in=ids) | Q(inflow_id__in=ids), status=TransferCandidate.Status.PENDING
+        ).delete()
+    return pairs
+
+
+def detect_transfers(since=None, window_days=None, auto_link=True, dry_run=False):
+    """
+    Busca pares entre las transacciones no vinculadas (desde `since`), vincula
+    los seguros (si auto_link) y deja el resto como candidatos pendientes.
+    Los pares descartados por el usuario no se vuelven a proponer.
+    """
+    window_days = window_days_setting() if window_days is None else window_days
+    unlinked = Transaction.objects.filter(
+        transfer_transaction__isnull=True, linked_transfer__isnull=True
+    ).exclude(amount=0)
+    if since:
+        # Una entrada del día `since` puede calzar con una salida hasta window_days antes
+        unlinked = unlinked.filter(date__gte=since - timedelta(days=window_days))
+    rows = list(unlinked.values_list('id', 'account_id', 'date', 'amount', 'raw_payee', 'category_id', named=True))
+
+    rejected = set(TransferCandidate.objects.filter(
+        status=TransferCandidate.Status.REJECTED
+    ).values_list('outflow_id', 'inflow_id'))
+    pairs = [pair for pair in find_transfer_pairs(rows, window_days) if pair[:2] not in rejected]
+    confident, ambiguous = split_confident(pairs, {row.id: row for row in rows}) if auto_link else ([], pairs)
+
+    result = TransferMatchResult(scanned=len(rows), dry_run=dry_run)
+    result.linked = [(out_id, in_id) for out_id, in_id, _ in confident]
+    result.queued = len(ambiguous)
+    if dry_run:
+        return result
+
+    with transaction.atomic():
+        if result.linked:
+            link_transfer_pairs(result.linked)
+        TransferCandidate.objects.bulk_create([
+            TransferCandidate(outflow_id=out_id, inflow_id=in_id, day_gap=gap)
+            for out_id, in_id, gap in ambiguous
+        ], ignore_conflicts=True)
+    return result
+
+
+def detect_recent_transfers():
+    """Lo que corre después de cada sincronización: sólo los últimos días."""
+    return detect_transfers(since=date.today() - timedelta(days=lookback_days_setting()))
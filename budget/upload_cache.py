@@ -0,0 +1,116 @@
+"""
+Cartolas subidas, guardadas una vez por contenido.
+
+El cliente sube el archivo sólo en el preview: se guarda como ImportUpload
+(sha256) y la ejecución recibe el hash y el mapeo. Lo que cuesta leer se
+reutiliza entre pasos:
+
+- El preview (header detectado, columnas, muestra) queda en el cache de Django.
+- Los .xls (xlrd sólo los lee enteros) se guardan ya leídos como pickle de
+  pandas en disco local, con desalojo LRU (IMPORT_PARSE_CACHE_ENTRIES). Los CSV y
+  .xlsx no: se leen en bloques a medida que se importan (y el preview sólo lee
+  las primeras filas), así que nunca se cargan enteros en memoria.
+
+Subir de nuevo el mismo archivo para la misma cuenta y mapeo no lo reprocesa:
+se devuelve el job anterior (ver previous_job).
+"""
+import hashlib
+import os
+import uuid
+from pathlib import Path
+
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError
+
+from .models import ImportUpload, ImportJob
+
+PREVIEW_KEY = 'import_preview:v2:{}'  # v2: incluye la huella del formato
+PREVIEW_TIMEOUT = 60 * 60 * 24
+DEFAULT_PARSE_CACHE_ENTRIES = 16
+
+
+def parse_cache_dir():
+    return Path(getattr(settings, 'IMPORT_PARSE_CACHE_DIR', Path(settings.BASE_DIR) / '.parse_cache'))
+
+
+def parse_cache_entries_setting():
+    return getattr(settings, 'IMPORT_PARSE_CACHE_ENTRIES', DEFAULT_PARSE_CACHE_ENTRIES)
+
+
+def file_sha256(file_obj):
+    digest = hashlib.sha256()
+    file_obj.seek(0)
+    for chunk in iter(lambda: file_obj.read(1024 * 1024), b''):
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+def store_upload(file_obj):
+    """ImportUpload del archivo; si ya se había subido (mismo contenido) no se vuelve a guardar."""
+    sha256 = file_sha256(file_obj)
+    upload = ImportUpload.objects.filter(sha256=sha256).first()
+    if upload:
+        return upload
+    try:
+        return ImportUpload.objects.create(sha256=sha256, file=file_obj, filename=file_obj.name, size=file_obj.size)
+    except IntegrityError:
+        # Otra request guardó el mismo archivo al mismo tiempo
+        return ImportUpload.objects.get(sha256=sha256)
+
+
+def get_upload(sha256):
+    return ImportUpload.objects.filter(sha256=sha256).first()
+
+
+def preview_upload(upload):
+    """preview_file del archivo guardado, calculado una vez por contenido."""
+    from .import_service import preview_file
+
+    key = PREVIEW_KEY.format(upload.sha256)
+    data = cache.get(key)
+    if data is None:
+        with upload.file.open('rb') as file_obj:
+            data = preview_file(file_obj, upload.filename, upload_hash=upload.sha256)
+        cache.set(key, data, PREVIEW_TIMEOUT)
+    return {**data, "upload_hash": upload.sha256}
+
+
+def previous_job(upload, account, mapping):
+    """Job no fallido del mismo archivo, cuenta y mapeo (el más reciente), o None."""
+    return ImportJob.objects.filter(
+        upload=upload, account=account, mapping=mapping
+    ).exclude(status=ImportJob.Status.FAILED).order_by('-created_at', '-id').first()
+
+
+def _evict(directory, keep):
+    entries = sorted(directory.glob('*.pkl'), key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in entries[keep:]:
+        path.unlink(missing_ok=True)
+
+
+def cached_excel_frame(file_obj, upload_hash, header_row):
+    """
+    pd.read_excel(file_obj, header=header_row), leído a lo más una vez por
+    (contenido, header) mientras siga entre las IMPORT_PARSE_CACHE_ENTRIES más recientes.
+    """
+    directory = parse_cache_dir()
+    path = directory / f"{upload_hash}-{header_row}.pkl"
+    try:
+        frame = pd.read_pickle(path)
+        os.utime(path)  # LRU: cada lectura lo deja como el más reciente
+        return frame
+    except (FileNotFoundError, EOFError):
+        pass
+
+    file_obj.seek(0)
+    frame = pd.read_excel(file_obj, header=header_row)
+    directory.mkdir(parents=True, exist_ok=True)
+    # Escritura atómica: otro proceso nunca lee un pickle a medias
+    tmp = directory / f".{uuid.uuid4().hex}.tmp"
+    frame.to_pickle(tmp)
+    os.replace(tmp, path)
+    _evict(directory, parse_cache_entries_setting())
+    return frame
@@ -10,13 +10,20 @@ router.register(r'categories', views.CategoryViewSet)
 router.register(r'payees', views.PayeeViewSet)
 router.register(r'email-sources', views.EmailSourceViewSet)
 router.register(r'email-rules', views.EmailRuleViewSet)
+router.register(r'transfer-candidates', views.TransferCandidateViewSet)
+router.register(r'import-jobs', views.ImportJobViewSet)
+router.register(r'import-profiles', views.ImportProfileViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
     path('budget_summary/', views.BudgetSummaryView.as_view(), name='budget_summary'),
+    path('budget_summary/range/', views.BudgetSummaryRangeView.as_view(), name='budget_summary_range'),
+    path('budget_summary/cache/', views.BudgetSummaryCacheView.as_view(), name='budget_summary_cache'),
     path('budget_assignment/', views.BudgetAssignmentView.as_view(), name='budget_assignment'),
+    path('budget_assignment/auto_fund/', views.BudgetAutoFundView.as_view(), name='budget_auto_fund'),
     path('trigger_sync/', views.TriggerSyncView.as_view(), name='trigger_sync'),
     path('import/preview/', views.ImportFileView.as_view(), name='import_preview'),
     path('import/execute/', views.ExecuteImportView.as_view(), name='import_execute'),
+    path('import/auto/', views.AutoImportView.as_view(), name='import_auto'),
     path('reports/', views.ReportsView.as_view(), name='reports'),
 ]
\ No newline at end of file
@@ -0,0 +1,73 @@
+"""
+Validación de patrones de reglas PayeeMatch.
+
+Las reglas regex se unen en una sola alternancia (ver payee_matcher.py), así
+que cada patrón debe compilar por sí solo, no puede usar grupos con nombre ni
+referencias hacia atrás, y no puede tener cuantificadores anidados del tipo
+(a+)+ que hacen que el motor de re retroceda en forma exponencial.
+"""
+import re
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+REPEATS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT}
+if hasattr(sre_parse, 'POSSESSIVE_REPEAT'):
+    REPEATS.add(sre_parse.POSSESSIVE_REPEAT)
+BACKREFERENCES = {sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS}
+
+
+class UnsafePattern(Exception):
+    pass
+
+
+def _children(op, av):
+    """Sub-patrones de un nodo del árbol de sre_parse."""
+    if op in REPEATS:
+        return [av[2]]
+    if op == sre_parse.SUBPATTERN:
+        return [av[-1]]
+    if op == sre_parse.BRANCH:
+        return av[1]
+    if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+        return [av[1]]
+    if op == getattr(sre_parse, 'ATOMIC_GROUP', None):
+        return [av]
+    return []
+
+
+def _check(items, inside_repeat):
+    for op, av in items:
+        if op in BACKREFERENCES:
+            raise UnsafePattern("No se permiten referencias a grupos (\\1, (?(1)...)).")
+        if op in REPEATS:
+            low, high = av[0], av[1]
+            variable = low != high
+            if variable and inside_repeat:
+                raise UnsafePattern(
+                    "Cuantificadores anidados como (a+)+ o (\\w*)* pueden colgar la importación; "
+                    "reescribe el patrón sin repetir un grupo que ya tiene +, * o {n,m}."
+                )
+            _check(av[2], inside_repeat or high > 1)
+            continue
+        for child in _children(op, av):
+            _check(child, inside_repeat)
+
+
+def regex_problem(pattern):
+    """Mensaje con el problema del patrón regex, o None si es seguro."""
+    try:
+        parsed = sre_parse.parse(pattern)
+        # Envuelto tal como va en la alternancia: (?i) a mitad de patrón falla aquí
+        re.compile(f"(?:{pattern})", re.IGNORECASE)
+    except re.error as exc:
+        return f"Regex inválida: {exc}"
+    if parsed.state.groupdict:
+        return "No se permiten grupos con nombre (?P<...>)."
+    try:
+        _check(parsed, inside_repeat=False)
+    except UnsafePattern as exc:
+        return str(exc)
+    return None
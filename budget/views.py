@@ -9,12 +9,28 @@ from rest_framework import viewsets, views
 from datetime import datetime, date, timedelta
 from decimal import Decimal
 from collections import defaultdict
-from .import_service import preview_file, process_import
+from dataclasses import asdict
+from .upload_cache import store_upload, get_upload, preview_upload
+from .summary_service import get_budget_summary, compute_range_summary, auto_fund_goals
+from .summary_cache import summary_cache_stats, invalidate_summary_cache, reset_summary_cache_stats
+from .balance_service import balance_at, net_worth_series, period_count
+from .spending_service import spending_cube, DIMENSIONS as SPENDING_DIMENSIONS
+from .pagination import TransactionPagination
+from .search import search_transactions
+from .ledger import bulk_update_transactions, bulk_delete_transactions
+from .rule_service import apply_payee_rules
+from .transfer_matcher import link_transfer_pairs, TransferAlreadyLinked
+from .import_jobs import enqueue_import
+from .import_profiles import find_profile, remember_profile, auto_import
 from dateutil.relativedelta import relativedelta
 
 # Importamos todos los modelos necesarios, incluyendo CategoryGroup
-from .models import Transaction, Account, Category, CategoryGroup, BudgetAssignment, Payee, EmailSource, EmailRule
-from .serializers import TransactionSerializer, AccountSerializer, CategorySerializer, CategoryGroupSerializer, PayeeSerializer, EmailSourceSerializer, EmailRuleSerializer
+from .models import Transaction, Account, Category, CategoryGroup, BudgetAssignment, Payee, EmailSource, EmailRule, TransferCandidate, ImportJob, ImportProfile
+from .serializers import (
+    TransactionSerializer, AccountSerializer, CategorySerializer, CategoryGroupSerializer, PayeeSerializer,
+    EmailSourceSerializer, EmailRuleSerializer, TransactionBulkSerializer, TransactionBulkFilterSerializer,
+    TransferCandidateSerializer, ImportJobSerializer, ImportProfileSerializer
+)
 
 class AccountViewSet(viewsets.ModelViewSet):
     queryset = Account.objects.all()
@@ -28,8 +44,18 @@ class AccountViewSet(viewsets.ModelViewSet):
         if target_balance is None:
             return Response({"error": "Se requiere target_balance"}, status=400)
 
-        current_balance = account.transactions.aggregate(Sum('amount'))['amount__sum'] or 0
-        diff = Decimal(str(target_balance)) - Decimal(current_balance)
+        # Opcional: cuadrar contra el saldo de una cartola a una fecha pasada (YYYY-MM-DD)
+        as_of = request.data.get('date')
+        if as_of:
+            try:
+                as_of = datetime.strptime(as_of, '%Y-%m-%d').date()
+            except (TypeError, ValueError):
+                return Response({"error": "Formato de fecha inválido (YYYY-MM-DD)"}, status=400)
+            current_balance = balance_at(account.id, as_of)
+        else:
+            as_of = date.today()
+            current_balance = account.balance
+        diff = Decimal(str(target_balance)) - current_balance
 
         if diff == 0:
             return Response({"status": "Saldo ya cuadrado", "balance": current_balance})
@@ -39,7 +65,7 @@ class AccountViewSet(viewsets.ModelViewSet):
             payee=None,
             raw_payee="Ajuste Manual de Saldo",
             amount=diff,
-            date=date.today(),
+            date=as_of,
             memo="Reconciliación automática"
         )
 
@@ -51,7 +77,7 @@ class CategoryGroupViewSet(viewsets.ModelViewSet):
     serializer_class = CategoryGroupSerializer
 
 class CategoryViewSet(viewsets.ModelViewSet):
-    queryset = Category.objects.all()
+    queryset = Category.objects.select_related('group')
     serializer_class = CategorySerializer
 
 class PayeeViewSet(viewsets.ReadOnlyModelViewSet): # ReadOnly porque solo queremos listarlos para sugerencias
@@ -59,10 +85,57 @@ class PayeeViewSet(viewsets.ReadOnlyModelViewSet): # ReadOnly porque solo querem
     serializer_class = PayeeSerializer
 
 class TransactionViewSet(viewsets.ModelViewSet):
-    queryset = Transaction.objects.all().order_by('-date', '-id')
+    # Todo lo que lee el serializer (incluye la cuenta de la contraparte de una transferencia)
+    queryset = Transaction.objects.select_related(
+        'account', 'category', 'payee', 'transfer_transaction__account'
+    ).order_by('-date', '-id')
     serializer_class = TransactionSerializer
+    pagination_class = TransactionPagination
     filterset_fields = ['account', 'category', 'date'] 
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        search = self.request.query_params.get('search')
+        if search and self.action == 'list':
+            # Ordenado por relevancia en modo numerado; con ?cursor= el orden vuelve a ser por fecha
+            queryset = search_transactions(queryset, search)
+        return queryset
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Cambia o borra muchas transacciones en un solo UPDATE/DELETE atómico.
+        Saldos, rollups y hechos de gasto se actualizan una vez por lote.
+        """
+        serializer = TransactionBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        if 'ids' in data:
+            ids = data['ids']
+        else:
+            lookups = TransactionBulkFilterSerializer.to_lookups(data['filter'])
+            ids = list(Transaction.objects.filter(**lookups).values_list('id', flat=True)[:TransactionBulkSerializer.MAX_IDS + 1])
+            if len(ids) > TransactionBulkSerializer.MAX_IDS:
+                return Response({"error": f"El filtro afecta más de {TransactionBulkSerializer.MAX_IDS} transacciones"}, status=400)
+
+        if data['delete']:
+            affected = bulk_delete_transactions(ids)
+        else:
+            affected = bulk_update_transactions(ids, data['patch'])
+
+        return Response({"affected": sorted(affected), "count": len(affected)})
+
+    @action(detail=False, methods=['post'])
+    def apply_rules(self, request):
+        """
+        Completa payee/categoría de las transacciones existentes con las reglas actuales.
+        Con {"dry_run": true} sólo retorna lo que cambiaría.
+        """
+        dry_run = str(request.data.get('dry_run', False)).lower() in ('true', '1')
+        result = apply_payee_rules(dry_run=dry_run)
+        return Response(asdict(result))
+
     @action(detail=False, methods=['post'])
     def link_transfer(self, request):
         id1 = request.data.get('id_1')
@@ -79,27 +152,8 @@ class TransactionViewSet(viewsets.ModelViewSet):
                 if tx1.id == tx2.id:
                     return Response({"error": "No puedes vincular una transacción consigo misma"}, status=400)
 
-                tx1.transfer_transaction = tx2
-                tx2.transfer_transaction = tx1
-                
-                # --- LÓGICA INTELIGENTE DE CATEGORÍAS ---
-                # Regla: Solo borramos la categoría si AMBAS cuentas son On-Budget.
-                # Si una es Off-Budget, esa transferencia es un gasto/ingreso real para el presupuesto.
-                
-                # Chequeamos si es una transferencia interna pura (ambas on-budget)
-                is_pure_internal = (not tx1.account.off_budget) and (not tx2.account.off_budget)
-
-                if is_pure_internal:
-                    tx1.category = None
-                    tx2.category = None
-                else:
-                    # Es una transferencia mixta (On -> Off). 
-                    # No forzamos borrar categoría. 
-                    # El usuario deberá asignarle una (ej: "Pago Hipoteca") en la interfaz.
-                    pass
-
-                tx1.save()
-                tx2.save()
+                # Misma lógica que la detección automática (categorías incluidas)
+                link_transfer_pairs([(tx1.id, tx2.id)])
 
             return Response({"status": "Transferencia vinculada exitosamente"})
 
@@ -181,6 +235,37 @@ class TransactionViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({"error": str(e)}, status=400)
 
+class TransferCandidateViewSet(viewsets.ReadOnlyModelViewSet):
+    """Pares que el detector de transferencias dejó para revisión (ver transfer_matcher.py)."""
+    queryset = TransferCandidate.objects.filter(
+        status=TransferCandidate.Status.PENDING
+    ).select_related('outflow__account', 'inflow__account').order_by('-outflow__date', 'day_gap', 'id')
+    serializer_class = TransferCandidateSerializer
+
+    @action(detail=True, methods=['post'])
+    def accept(self, request, pk=None):
+        with transaction.atomic():
+            # Bloqueado: dos aceptaciones del mismo candidato no compiten
+            candidate = TransferCandidate.objects.select_for_update().filter(
+                pk=pk, status=TransferCandidate.Status.PENDING
+            ).first()
+            if candidate is None:
+                return Response({"error": "Candidato no encontrado o ya resuelto"}, status=404)
+            try:
+                link_transfer_pairs([(candidate.outflow_id, candidate.inflow_id)])
+            except TransferAlreadyLinked as e:
+                # Otro vínculo se adelantó: el candidato ya no aplica
+                candidate.delete()
+                return Response({"error": str(e)}, status=409)
+        return Response({"status": "Transferencia vinculada exitosamente"})
+
+    @action(detail=True, methods=['post'])
+    def reject(self, request, pk=None):
+        candidate = self.get_object()
+        candidate.status = TransferCandidate.Status.REJECTED
+        candidate.save(update_fields=['status'])
+        return Response({"status": "Candidato descartado"})
+
 class BudgetSummaryView(views.APIView):
     def get(self, request):
         month_param = request.query_params.get('month')
@@ -194,226 +279,47 @@ class BudgetSummaryView(views.APIView):
             today = date.today()
             target_month_start = today.replace(day=1)
 
-        next_month = (target_month_start.replace(day=28) + timedelta(days=4)).replace(day=1)
-        
-        def fmt(val):
-            return "{:,.0f}".format(val).replace(",", ".")
-    
-        # --- 1. RTA ACUMULATIVO ---
-        # CAMBIO TRACKING: Solo sumamos cuentas que NO son off_budget
-        liquid_accounts = Account.objects.filter(
-            account_type__in=['CHECKING', 'SAVINGS', 'CASH'],
-            off_budget=False 
-        )
-        
-        total_cash = 0
-        for acc in liquid_accounts:
-            total_cash += acc.transactions.aggregate(Sum('amount'))['amount__sum'] or 0
-
-        total_assigned_all_time = BudgetAssignment.objects.aggregate(Sum('amount'))['amount__sum'] or 0
-        ready_to_assign = total_cash - total_assigned_all_time
-
-        # --- 2. DATOS TARJETAS ---
-        # (Esta parte se mantiene igual, calculando gastos y pagos de TC)
-        cc_spending_all_time = Transaction.objects.filter(
-            date__lt=next_month,
-            account__account_type=Account.Type.CREDIT_CARD,
-            transfer_transaction__isnull=True,
-            category__isnull=False
-        ).values('account').annotate(total_spent=Sum('amount'))
-        
-        cc_spending_map = { e['account']: abs(e['total_spent']) for e in cc_spending_all_time }
-
-        cc_payments_all_time = Transaction.objects.filter(
-            date__lt=next_month,
-            account__account_type=Account.Type.CREDIT_CARD,
-            transfer_transaction__isnull=False,
-            amount__gt=0
-        ).values('account').annotate(total_paid=Sum('amount'))
-        
-        cc_payment_map = { e['account']: e['total_paid'] for e in cc_payments_all_time }
+        # El cálculo completo vive en summary_service (consultas agrupadas, no por categoría)
+        payload, cache_hit = get_budget_summary(target_month_start)
+        response = Response(payload)
+        response['X-Budget-Cache'] = 'HIT' if cache_hit else 'MISS'
+        return response
 
-        # --- 3. BUCLE PRINCIPAL ---
-        total_assigned_month = 0
-        total_activity_month = 0
-        total_available = 0
-        
-        groups = CategoryGroup.objects.filter(is_active=True).order_by('order', 'name')
-        grouped_data = []
+class BudgetSummaryRangeView(views.APIView):
+    """
+    Resumen de varios meses en una sola respuesta: ?from=YYYY-MM&to=YYYY-MM
+    """
+    MAX_MONTHS = 120
 
-        for group in groups:
-            group_categories = []
-            cats = group.categories.filter(is_active=True).order_by('order', 'name')
-            
-            for cat in cats:
-                # A. Asignado
-                assignment_this_month = BudgetAssignment.objects.filter(
-                    category=cat, month=target_month_start
-                ).first()
-                val_assigned_this_month = assignment_this_month.amount if assignment_this_month else 0
-
-                val_assigned_cumulative = BudgetAssignment.objects.filter(
-                    category=cat, month__lte=target_month_start
-                ).aggregate(Sum('amount'))['amount__sum'] or 0
-
-                # B. Actividad ESTE MES
-                # CAMBIO TRACKING: Usamos Q objects para incluir transferencias a Off-Budget
-                activity_month_result = Transaction.objects.filter(
-                    category=cat,
-                    date__year=target_month_start.year,
-                    date__month=target_month_start.month
-                ).filter(
-                    # Condición: O es gasto normal (sin transfer) O es transfer hacia Off-Budget
-                    Q(transfer_transaction__isnull=True) | 
-                    Q(transfer_transaction__account__off_budget=True)
-                ).aggregate(total=Sum('amount'))
-                
-                val_activity_month = activity_month_result['total'] or 0
-
-                # C. Actividad ACUMULADA (Para Rollover)
-                # CAMBIO TRACKING: Mismo filtro Q aquí
-                activity_cumulative_result = Transaction.objects.filter(
-                    category=cat,
-                    date__lt=next_month
-                ).filter(
-                    Q(transfer_transaction__isnull=True) | 
-                    Q(transfer_transaction__account__off_budget=True)
-                ).aggregate(total=Sum('amount'))
-                
-                val_activity_cumulative = activity_cumulative_result['total'] or 0
-
-                # D. Cálculo Disponible
-                available_amount = val_assigned_cumulative + val_activity_cumulative
-
-                # E. Lógica TC
-                if hasattr(cat, 'credit_account'): 
-                    card_id = cat.credit_account.id
-                    funded = cc_spending_map.get(card_id, 0)
-                    paid = cc_payment_map.get(card_id, 0)
-                    available_amount = funded - paid
-                    
-                    monthly_payments = Transaction.objects.filter(
-                        category=None,
-                        account__id=card_id,
-                        date__year=target_month_start.year,
-                        date__month=target_month_start.month,
-                        transfer_transaction__isnull=False,
-                        amount__gt=0
-                    ).aggregate(Sum('amount'))['amount__sum'] or 0
-                    
-                    if monthly_payments > 0:
-                        val_activity_month = -monthly_payments
-
-                # --- CÁLCULO DE META (GOAL) ---
-                goal_status = {
-                    "type": cat.goal_type,
-                    "target": cat.goal_amount,
-                    "required": 0,
-                    "is_met": False,
-                    "percentage": 0,
-                    "message": "" 
-                }
-
-                if cat.goal_type == 'MONTHLY':
-                    # Meta: Asignar X monto este mes
-                    goal_status["required"] = max(0, cat.goal_amount - val_assigned_this_month)
-                    goal_status["is_met"] = val_assigned_this_month >= cat.goal_amount
-                    raw_pct = int((val_assigned_this_month / cat.goal_amount) * 100) if cat.goal_amount > 0 else 0
-                    goal_status["percentage"] = max(0, min(100, raw_pct))
-                    
-                    if goal_status["is_met"]:
-                        goal_status["message"] = "Meta mensual cumplida"
-                    else:
-                        goal_status["message"] = f"Faltan ${fmt(goal_status['required'])}"
-
-                elif cat.goal_type == 'TARGET_BALANCE':
-                    # Meta: Que el disponible sea al menos X
-                    goal_status["required"] = max(0, cat.goal_amount - available_amount)
-                    goal_status["is_met"] = available_amount >= cat.goal_amount
-                    raw_pct = int((available_amount / cat.goal_amount) * 100) if cat.goal_amount > 0 else 0
-                    goal_status["percentage"] = max(0, min(100, raw_pct))
-                    
-                    if goal_status["is_met"]:
-                        goal_status["message"] = "Saldo objetivo alcanzado"
-                    else:
-                        goal_status["message"] = f"Falta juntar ${fmt(goal_status['required'])}"
-
-                elif cat.goal_type == 'TARGET_DATE' and cat.goal_target_date:
-                    # Lógica "On Track":
-                    # 1. ¿Cuánto tenía antes de empezar este mes? (Aprox)
-                    # Asumimos que lo asignado este mes es el aporte nuevo.
-                    # available_start = available_amount - val_assigned_this_month
-                    # (Nota: Esto asume que no hubo gastos este mes que bajaron el available, 
-                    # pero para metas de ahorro suele ser correcto).
-                    
-                    if available_amount >= cat.goal_amount:
-                        goal_status["is_met"] = True
-                        goal_status["percentage"] = 100
-                        goal_status["message"] = "¡Meta lograda! 🎉"
-                    else:
-                        # Cálculo de meses
-                        today_date = date.today()
-                        # Usamos la fecha target de la categoría
-                        target_dt = cat.goal_target_date
-                        
-                        # Meses restantes incluyendo el actual
-                        months_diff = (target_dt.year - target_month_start.year) * 12 + (target_dt.month - target_month_start.month) + 1
-                        months_remaining = max(1, months_diff)
-                        
-                        # Cuánto faltaba en total antes de asignar hoy
-                        # Si available < assigned (ej: gastaste), usamos 0 para no romper la lógica negativa
-                        balance_before_assignment = available_amount - val_assigned_this_month
-                        total_missing_at_start = max(0, cat.goal_amount - balance_before_assignment)
-                        
-                        # Cuota mensual sugerida
-                        monthly_suggested = total_missing_at_start / months_remaining
-                        
-                        # ¿Cumpliste la cuota de este mes?
-                        # Usamos un margen pequeño de error por decimales
-                        is_on_track = val_assigned_this_month >= (monthly_suggested - 1)
-                        
-                        goal_status["is_met"] = is_on_track
-                        goal_status["required"] = max(0, monthly_suggested - val_assigned_this_month)
-                        
-                        # Porcentaje del TOTAL acumulado
-                        raw_pct = int((available_amount / cat.goal_amount) * 100) if cat.goal_amount > 0 else 0
-                        goal_status["percentage"] = max(0, min(100, raw_pct))
-                        
-                        if is_on_track:
-                            goal_status["message"] = "Vas bien este mes 👍"
-                        else:
-                            goal_status["message"] = f"Aporta ${fmt(monthly_suggested)} este mes"
-
-                # Globales
-                total_assigned_month += val_assigned_this_month
-                total_activity_month += val_activity_month
-                total_available += available_amount
-
-                group_categories.append({
-                    "category_id": cat.id,
-                    "category_name": cat.name,
-                    "assigned": val_assigned_this_month,
-                    "activity": val_activity_month,
-                    "available": available_amount,
-                    "goal": goal_status
-                })
-            
-            grouped_data.append({
-                "group_id": group.id,
-                "group_name": group.name,
-                "categories": group_categories
-            })
+    def get(self, request):
+        try:
+            from_month = datetime.strptime(request.query_params.get('from', ''), '%Y-%m').date()
+            to_month = datetime.strptime(request.query_params.get('to', ''), '%Y-%m').date()
+        except ValueError:
+            return Response({"error": "Se requieren 'from' y 'to' con formato YYYY-MM"}, status=400)
 
-        return Response({
-            "month": target_month_start.strftime('%Y-%m-%d'),
-            "ready_to_assign": ready_to_assign,
-            "groups": grouped_data,
-            "totals": {
-                "assigned": total_assigned_month,
-                "activity": total_activity_month,
-                "available": total_available
-            }
-        })
+        if from_month > to_month:
+            return Response({"error": "'from' debe ser anterior o igual a 'to'"}, status=400)
+
+        months = (to_month.year - from_month.year) * 12 + (to_month.month - from_month.month) + 1
+        if months > self.MAX_MONTHS:
+            return Response({"error": f"El rango no puede superar {self.MAX_MONTHS} meses"}, status=400)
+
+        return Response(compute_range_summary(from_month, to_month))
+
+class BudgetSummaryCacheView(views.APIView):
+    """
+    Contadores del cache del resumen mensual (hits/misses/invalidaciones). Son
+    aproximados: con varios procesos se puede perder algún incremento.
+    DELETE vacía el cache y reinicia los contadores.
+    """
+    def get(self, request):
+        return Response(summary_cache_stats())
+
+    def delete(self, request):
+        invalidate_summary_cache()
+        reset_summary_cache_stats()
+        return Response({"status": "Cache vaciado"})
 
 class BudgetAssignmentView(views.APIView):
     def post(self, request):
@@ -441,6 +347,23 @@ class BudgetAssignmentView(views.APIView):
         except Exception as e:
             return Response({"error": str(e)}, status=400)
 
+class BudgetAutoFundView(views.APIView):
+    """
+    Completa las metas no cumplidas del mes usando el dinero Listo para Asignar.
+    """
+    def post(self, request):
+        month_str = request.data.get('month')
+        if not month_str:
+            return Response({"error": "Faltan datos"}, status=400)
+
+        try:
+            target_month = datetime.strptime(month_str, '%Y-%m-%d').date().replace(day=1)
+        except ValueError:
+            return Response({"error": "Formato de fecha inválido"}, status=400)
+
+        funded, remaining = auto_fund_goals(target_month)
+        return Response({"status": "success", "funded": funded, "ready_to_assign": remaining})
+
 class TriggerSyncView(views.APIView):
     """
     Endpoint para disparar la sincronización manual.
@@ -459,127 +382,274 @@ class EmailSourceViewSet(viewsets.ModelViewSet):
     serializer_class = EmailSourceSerializer
 
 class EmailRuleViewSet(viewsets.ModelViewSet):
-    queryset = EmailRule.objects.all()
+    queryset = EmailRule.objects.select_related('source', 'account')
     serializer_class = EmailRuleSerializer
 
+def find_account(account_id):
+    """La cuenta con ese id, o None si no existe (o el id no es un número)."""
+    try:
+        return Account.objects.filter(pk=account_id).first()
+    except (TypeError, ValueError):
+        return None
+
 class ImportFileView(views.APIView):
     def post(self, request):
         """
-        Paso 1: Recibe archivo, devuelve columnas detectadas.
+        Paso 1: Recibe archivo, lo guarda (una vez por contenido) y devuelve columnas
+        detectadas junto al upload_hash con que se ejecuta el paso 2.
+        Con account_id, incluye el perfil guardado para este formato (si hay).
         """
         file_obj = request.FILES.get('file')
         if not file_obj:
             return Response({"error": "No se envió archivo"}, status=400)
         
         try:
-            # Leemos en memoria para preview
-            # (Si el archivo es gigante, esto podría optimizarse, pero para excels personales está bien)
-            data = preview_file(file_obj, file_obj.name)
-            return Response(data)
+            # Para CSV sólo se lee el comienzo del archivo (ver import_service.detect_csv_layout)
+            data = preview_upload(store_upload(file_obj))
         except Exception as e:
             return Response({"error": str(e)}, status=400)
 
+        account_id = request.data.get('account_id')
+        profile = None
+        if account_id:
+            account = find_account(account_id)
+            if account is None:
+                return Response({"error": "Cuenta no encontrada"}, status=404)
+            profile = find_profile(account, data['fingerprint'])
+        data['profile'] = ImportProfileSerializer(profile).data if profile else None
+        return Response(data)
+
 class ExecuteImportView(views.APIView):
     def post(self, request):
         """
-        Paso 2: Recibe archivo + mapeo y procesa.
+        Paso 2: Recibe upload_hash (o el archivo) + mapeo y deja la importación en cola.
+        Responde de inmediato con el job; el avance se consulta en import-jobs/<id>/.
+        Si el mismo archivo ya se importó con ese mapeo en la cuenta, devuelve ese reporte.
+        El mapeo queda guardado como perfil del formato (salvo remember=false).
         """
         file_obj = request.FILES.get('file')
+        upload_hash = request.data.get('upload_hash')
         # El mapeo viene como string JSON dentro del form-data
         import json
-        mapping = json.loads(request.data.get('mapping')) 
+        mapping = request.data.get('mapping')
+        if isinstance(mapping, str):
+            try:
+                mapping = json.loads(mapping)
+            except ValueError:
+                return Response({"error": "El mapeo no es JSON válido"}, status=400)
+        if mapping and not isinstance(mapping, dict):
+            return Response({"error": "El mapeo debe ser un objeto"}, status=400)
         account_id = request.data.get('account_id')
         
-        if not all([file_obj, mapping, account_id]):
+        if not all([file_obj or upload_hash, mapping, account_id]):
+            return Response({"error": "Datos incompletos"}, status=400)
+
+        account = find_account(account_id)
+        if account is None:
+            return Response({"error": "Cuenta no encontrada"}, status=404)
+        upload = store_upload(file_obj) if file_obj else get_upload(upload_hash)
+        if upload is None:
+            return Response({"error": "Archivo no encontrado, vuelve a subirlo"}, status=404)
+
+        if request.data.get('remember', True) not in (False, 'false', '0'):
+            try:
+                # El preview lee el archivo: uno que no se puede leer no deja perfil
+                preview = preview_upload(upload)
+            except Exception as e:
+                return Response({"error": str(e)}, status=400)
+            remember_profile(account, preview, mapping, name=upload.filename)
+
+        job, created = enqueue_import(account, upload, mapping)
+        if not created and job.status == ImportJob.Status.DONE:
+            return Response({**ImportJobSerializer(job).data, "status": "already_imported", "job_id": job.id})
+        return Response({"status": "queued", "job_id": job.id}, status=202)
+
+class AutoImportView(views.APIView):
+    def post(self, request):
+        """
+        Preview + ejecución en una sola request (archivo + account_id), usando el perfil
+        guardado para el formato del archivo. Sin perfil responde needs_mapping con el
+        preview, para elegir las columnas una vez en import/execute/.
+        """
+        file_obj = request.FILES.get('file')
+        account_id = request.data.get('account_id')
+        if not all([file_obj, account_id]):
             return Response({"error": "Datos incompletos"}, status=400)
 
+        account = find_account(account_id)
+        if account is None:
+            return Response({"error": "Cuenta no encontrada"}, status=404)
+
         try:
-            account = Account.objects.get(pk=account_id)
-            report = process_import(file_obj, file_obj.name, mapping, account)
-            
-            return Response({
-                "status": "success", 
-                "imported": report['imported'],
-                "duplicated": report['duplicated'] # <--- ENVIAMOS AL FRONT
-            })
+            result = auto_import(account, store_upload(file_obj))
         except Exception as e:
-            return Response({"error": str(e)}, status=500)
-        
+            return Response({"error": str(e)}, status=400)
+
+        if result.status == 'needs_mapping':
+            return Response({"status": result.status, **result.preview}, status=422)
+        payload = {"status": result.status, "job_id": result.job.id, "profile": ImportProfileSerializer(result.profile).data}
+        if result.status == 'already_imported':
+            return Response({**ImportJobSerializer(result.job).data, **payload})
+        return Response(payload, status=202)
+
+class ImportProfileViewSet(viewsets.ModelViewSet):
+    """Mapeos guardados por cuenta y formato de cartola (ver import_profiles.py). Se crean al importar."""
+    queryset = ImportProfile.objects.order_by('account', '-last_used_at', 'id')
+    serializer_class = ImportProfileSerializer
+    http_method_names = ['get', 'patch', 'delete', 'head', 'options']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        account_id = self.request.query_params.get('account')
+        if account_id:
+            queryset = queryset.filter(account_id=account_id) if account_id.isdigit() else queryset.none()
+        return queryset
+
+class ImportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Estado y avance de las importaciones en segundo plano (ver import_jobs.py)."""
+    queryset = ImportJob.objects.select_related('account', 'upload').order_by('-created_at', '-id')
+    serializer_class = ImportJobSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        account_id = self.request.query_params.get('account')
+        if account_id:
+            queryset = queryset.filter(account_id=account_id) if account_id.isdigit() else queryset.none()
+        return queryset
+
 class ReportsView(views.APIView):
     def get(self, request):
         report_type = request.query_params.get('type', 'net_worth')
         
         if report_type == 'net_worth':
-            return self.get_net_worth_data()
+            return self.get_net_worth_data(request)
         elif report_type == 'spending':
-            return self.get_spending_data()
+            return self.get_spending_data(request)
+        elif report_type == 'goals':
+            return self.get_goals_data(request)
         
         return Response({"error": "Tipo de reporte inválido"}, status=400)
 
-    def get_net_worth_data(self):
+    NET_WORTH_MAX_POINTS = 5000
+    NET_WORTH_LABELS = {
+        'day': lambda d: d.strftime('%d %b %Y'),
+        'week': lambda d: d.strftime('%d %b %Y'),
+        'month': lambda d: d.strftime('%b %Y'), # Ej: "Dec 2025"
+        'quarter': lambda d: f"Q{(d.month - 1) // 3 + 1} {d.year}",
+    }
+
+    def _parse_report_date(self, value, end_of_month=False):
+        """Acepta YYYY-MM-DD o YYYY-MM (día 1, o el último día con end_of_month)."""
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            month = datetime.strptime(value, '%Y-%m').date()
+            return month + relativedelta(months=1, days=-1) if end_of_month else month
+
+    def get_net_worth_data(self, request):
         """
-        Calcula Activos, Pasivos y Neto para los últimos 12 meses.
+        Activos, Pasivos y Neto al cierre de cada período (por defecto los últimos 12 meses).
+        Parámetros opcionales: from, to (YYYY-MM o YYYY-MM-DD) y granularity (day/week/month/quarter).
+        Toda la serie sale de una sola consulta, sin importar el largo del rango.
         """
-        today = date.today()
-        data = []
+        granularity = request.query_params.get('granularity', 'month')
+        if granularity not in self.NET_WORTH_LABELS:
+            return Response({"error": "granularity debe ser day, week, month o quarter"}, status=400)
 
-        # Iteramos los últimos 12 meses (de pasado a presente)
-        for i in range(11, -1, -1):
-            # Fecha de corte: El último día del mes 'i'
-            # Truco: Primer día del mes actual - i meses, luego ir al último día
-            month_date = (today.replace(day=1) - relativedelta(months=i))
-            # Ultimo día del mes: (Mes siguiente día 1) - 1 día
-            end_of_month = (month_date + relativedelta(months=1)).replace(day=1) 
-            
-            # Filtro base: Transacciones ocurridas antes o en el fin de ese mes
-            history_filter = Q(date__lt=end_of_month)
-
-            # 1. Activos (Assets + Cash)
-            assets_val = Transaction.objects.filter(
-                history_filter,
-                account__account_type__in=['CHECKING', 'SAVINGS', 'CASH', 'ASSET']
-            ).aggregate(total=Sum('amount'))['total'] or 0
-
-            # 2. Pasivos (Liabilities + Credit Cards)
-            # Nota: Las deudas suelen ser negativas en la BD.
-            debts_val = Transaction.objects.filter(
-                history_filter,
-                account__account_type__in=['CREDIT', 'LOAN']
-            ).aggregate(total=Sum('amount'))['total'] or 0
-
-            data.append({
-                "month": month_date.strftime('%b %Y'), # Ej: "Dec 2025"
+        try:
+            today = date.today()
+            # Por defecto hasta el cierre del mes en curso: cada punto es un cierre de mes
+            to_date = self._parse_report_date(request.query_params['to'], end_of_month=True) if 'to' in request.query_params else today + relativedelta(day=31)
+            from_date = self._parse_report_date(request.query_params['from']) if 'from' in request.query_params else to_date.replace(day=1) - relativedelta(months=11)
+        except ValueError:
+            return Response({"error": "Formato de fecha inválido (YYYY-MM o YYYY-MM-DD)"}, status=400)
+
+        if from_date > to_date:
+            return Response({"error": "'from' debe ser anterior o igual a 'to'"}, status=400)
+        if period_count(from_date, to_date, granularity) > self.NET_WORTH_MAX_POINTS:
+            return Response({"error": f"El rango no puede superar {self.NET_WORTH_MAX_POINTS} períodos"}, status=400)
+
+        label = self.NET_WORTH_LABELS[granularity]
+        data = [
+            {
+                "month": label(period),
+                "period": period.isoformat(),
                 "Assets": assets_val,
                 "Debts": debts_val, # Se graficará negativo
                 "Net Worth": assets_val + debts_val
-            })
-
+            }
+            for period, assets_val, debts_val in net_worth_series(from_date, to_date, granularity)
+        ]
         return Response(data)
 
-    def get_spending_data(self):
+    def get_spending_data(self, request):
         """
-        Agrupa gastos por Grupo de Categoría del mes actual (o rango seleccionado).
+        Gastos agrupados por las dimensiones pedidas (por defecto: grupo de categoría del mes actual).
+        Parámetros opcionales:
+          from, to: YYYY-MM (inclusive)
+          dimensions: lista separada por comas de group, category, payee, account, month
+          group, category, payee, account: id para hacer drilldown
+        Lee la tabla de hechos SpendingFact (gastos con categoría que no son transferencias).
         """
-        today = date.today()
-        start_date = today.replace(day=1)
-        
-        # Filtramos:
-        # 1. Fechas de este mes
-        # 2. Solo gastos (amount < 0)
-        # 3. Que tengan categoría (no pagos internos sin categoría)
-        # 4. Que NO sean transferencias internas
-        expenses = Transaction.objects.filter(
-            date__gte=start_date,
-            amount__lt=0,
-            category__isnull=False,
-            transfer_transaction__isnull=True
-        ).values('category__group__name').annotate(total=Sum('amount')).order_by('total')
-
+        try:
+            today = date.today().replace(day=1)
+            from_month = datetime.strptime(request.query_params['from'], '%Y-%m').date() if 'from' in request.query_params else today
+            to_month = datetime.strptime(request.query_params['to'], '%Y-%m').date() if 'to' in request.query_params else from_month
+        except ValueError:
+            return Response({"error": "Formato de fecha inválido (YYYY-MM)"}, status=400)
+
+        if from_month > to_month:
+            return Response({"error": "'from' debe ser anterior o igual a 'to'"}, status=400)
+
+        dimensions = [d.strip() for d in request.query_params.get('dimensions', 'group').split(',') if d.strip()]
+        invalid = [d for d in dimensions if d not in SPENDING_DIMENSIONS]
+        if not dimensions or invalid or len(set(dimensions)) != len(dimensions):
+            return Response({"error": f"dimensions debe combinar: {', '.join(SPENDING_DIMENSIONS)}"}, status=400)
+
+        filters = {}
+        for dim in ('group', 'category', 'payee', 'account'):
+            if dim in request.query_params:
+                try:
+                    filters[dim] = int(request.query_params[dim])
+                except ValueError:
+                    return Response({"error": f"'{dim}' debe ser un id"}, status=400)
+
+        return Response(spending_cube(from_month, to_month, dimensions, filters))
+
+    def get_goals_data(self, request):
+        """
+        Avance de las metas mes a mes (por defecto los últimos 12 meses).
+        Usa el motor de metas sobre el rango completo en una sola pasada.
+        """
+        try:
+            today = date.today().replace(day=1)
+            to_month = datetime.strptime(request.query_params['to'], '%Y-%m').date() if 'to' in request.query_params else today
+            from_month = datetime.strptime(request.query_params['from'], '%Y-%m').date() if 'from' in request.query_params else to_month - relativedelta(months=11)
+        except ValueError:
+            return Response({"error": "Formato de fecha inválido (YYYY-MM)"}, status=400)
+
+        if from_month > to_month:
+            return Response({"error": "'from' debe ser anterior o igual a 'to'"}, status=400)
+
+        # Mismo tope que el resumen por rango: el cálculo crece con la cantidad de meses
+        max_months = BudgetSummaryRangeView.MAX_MONTHS
+        months = (to_month.year - from_month.year) * 12 + (to_month.month - from_month.month) + 1
+        if months > max_months:
+            return Response({"error": f"El rango no puede superar {max_months} meses"}, status=400)
+
+        summary = compute_range_summary(from_month, to_month)
         data = []
-        for entry in expenses:
+        for idx, month in enumerate(summary["months"]):
+            goals = [
+                cat["months"][idx]["goal"]
+                for group in summary["groups"] for cat in group["categories"]
+                if cat["months"][idx]["goal"]["type"] != Category.GoalType.NONE
+            ]
             data.append({
-                "name": entry['category__group__name'],
-                "value": abs(entry['total']) # Convertir a positivo para el gráfico de torta
+                "month": month,
+                "goals": len(goals),
+                "met": sum(1 for g in goals if g["is_met"]),
+                "required": sum(g["required"] for g in goals)
             })
 
-        return Response(data)
\ No newline at end of file
+        return Response(data)
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'budget',
@@ -132,6 +133,31 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache del resumen mensual del presupuesto.
+# Basado en archivos para que web y scheduler (procesos distintos) compartan las invalidaciones.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR', str(BASE_DIR / '.cache')),
+    }
+}
+BUDGET_SUMMARY_CACHE_TIMEOUT = 60 * 60 * 24  # Segundos
+
+# Detección de transferencias entre cuentas propias (ver budget/transfer_matcher.py)
+TRANSFER_MATCH_WINDOW_DAYS = 3  # Máxima diferencia de días entre la salida y la entrada
+TRANSFER_MATCH_LOOKBACK_DAYS = 90  # Días hacia atrás que revisa cada sincronización
+
+# Archivos subidos (cartolas de las importaciones en segundo plano).
+# En disco compartido: la web los guarda y el scheduler los procesa.
+MEDIA_ROOT = os.environ.get('MEDIA_DIR', str(BASE_DIR / 'media'))
+
+# Importaciones en segundo plano (ver budget/import_jobs.py, corren en el scheduler)
+IMPORT_WORKERS = 2  # Importaciones simultáneas (de cuentas distintas)
+IMPORT_POLL_SECONDS = 2  # Cada cuánto se revisa la cola
+# Planillas .xls ya leídas (pickle de pandas) que se reutilizan entre preview y ejecución (ver budget/upload_cache.py)
+IMPORT_PARSE_CACHE_DIR = os.environ.get('PARSE_CACHE_DIR', str(BASE_DIR / '.parse_cache'))
+IMPORT_PARSE_CACHE_ENTRIES = 16  # Archivos que se mantienen (se desaloja el de uso más antiguo)
+
 # Permitir que cualquiera hable con la API (En producción esto se restringe al dominio del frontend)
 CORS_ALLOW_ALL_ORIGINS = True
 
@@ -5,6 +5,9 @@ import Button from './ui/Button';
 import Select from './ui/Select';
 import Input from './ui/Input';
 
+// Tiempo máximo que esperamos a que un worker tome la importación
+const PENDING_TIMEOUT_MS = 60 * 1000;
+
 const FileImportModal = ({ isOpen, onClose, accounts, onSuccess }) => {
   const [step, setStep] = useState(1);
   const [loading, setLoading] = useState(false);
@@ -13,6 +16,7 @@ const FileImportModal = ({ isOpen, onClose, accounts, onSuccess }) => {
   const [selectedFile, setSelectedFile] = useState(null);
   const [selectedAccount, setSelectedAccount] = useState('');
   const [previewData, setPreviewData] = useState(null);
+  const [jobProgress, setJobProgress] = useState(null);
   
   const [mapping, setMapping] = useState({
     date_col: '',
@@ -29,6 +33,7 @@ const FileImportModal = ({ isOpen, onClose, accounts, onSuccess }) => {
     setSelectedFile(null);
     setSelectedAccount('');
     setPreviewData(null);
+    setJobProgress(null);
     setLoading(false);
     setError(null);
     setMapping({ date_col: '', payee_col: '', amount_mode: 'separate', amount_col: '', amount_in_col: '', amount_out_col: '', invert_amount: false });
@@ -45,6 +50,7 @@ const FileImportModal = ({ isOpen, onClose, accounts, onSuccess }) => {
 
     const formData = new FormData();
     formData.append('file', selectedFile);
+    formData.append('account_id', selectedAccount);
 
     try {
         const res = await fetch(`${API_URL}/api/import/preview/`, { method: 'POST', body: formData });
@@ -53,6 +59,13 @@ const FileImportModal = ({ isOpen, onClose, accounts, onSuccess }) => {
         const data = await res.json();
         setPreviewData(data);
         
+        // Formato ya importado antes en esta cuenta: se usa el mapeo guardado
+        if (data.profile) {
+            setMapping(prev => ({ ...prev, ...data.profile.mapping }));
+            setStep(2);
+            return;
+        }
+
         const cols = data.columns.map(c => c.toLowerCase());
         setMapping(prev => ({
             ...prev,
@@ -71,21 +84,44 @@ const FileImportModal = ({ isOpen, onClose, accounts, onSuccess }) => {
     }
   };
 
+  // La importación corre en segundo plano: consultamos el job hasta que termine.
+  // Si nadie lo toma (el scheduler no está corriendo) dejamos de esperar.
+  const waitForJob = async (jobId) => {
+    const queuedSince = Date.now();
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const res = await fetch(`${API_URL}/api/import-jobs/${jobId}/`);
+        if (!res.ok) throw new Error("Error consultando el estado de la importación.");
+        const job = await res.json();
+        setJobProgress(job);
+        if (job.status === 'DONE' || job.status === 'FAILED') return job;
+        if (job.status === 'PENDING' && Date.now() - queuedSince > PENDING_TIMEOUT_MS) {
+            throw new Error("La importación sigue en cola: revisa que el servicio scheduler esté corriendo. Se procesará cuando arranque.");
+        }
+    }
+  };
+
   const handleExecute = async () => {
     setLoading(true);
     setError(null);
+    setJobProgress(null);
 
-    const formData = new FormData();
-    formData.append('file', selectedFile);
-    formData.append('account_id', selectedAccount);
-    formData.append('mapping', JSON.stringify(mapping));
+    // El archivo ya quedó guardado en el preview: sólo se manda su hash
+    const body = { upload_hash: previewData.upload_hash, account_id: selectedAccount, mapping };
 
     try {
-        const res = await fetch(`${API_URL}/api/import/execute/`, { method: 'POST', body: formData });
+        const res = await fetch(`${API_URL}/api/import/execute/`, {
+            method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(body)
+        });
         if (!res.ok) throw new Error("Error procesando el archivo.");
         const result = await res.json();
-        
-        alert(`Proceso finalizado.\n\n✅ Nuevas importadas: ${result.imported}\n⚠️ Duplicadas (omitidas): ${result.duplicated}`);
+        // Mismo archivo ya importado con este mapeo: el reporte viene en la respuesta
+        const job = result.status === 'already_imported' ? result : await waitForJob(result.job_id);
+        if (job.status === 'FAILED') throw new Error(`La importación falló: ${job.error_message}`);
+
+        const failedText = job.failed ? `\n❌ Con error (omitidas): ${job.failed}` + job.errors.slice(0, 5).map(e => `\n   Fila ${e.row}: ${e.error}`).join('') : '';
+        const title = result.status === 'already_imported' ? 'Este archivo ya se había importado con este mapeo.' : 'Proceso finalizado.';
+        alert(`${title}\n\n✅ Nuevas importadas: ${job.imported}\n⚠️ Duplicadas (omitidas): ${job.duplicated}${failedText}`);
         onSuccess(); 
         onClose();
         resetState();
@@ -135,6 +171,11 @@ const FileImportModal = ({ isOpen, onClose, accounts, onSuccess }) => {
 
         {step === 2 && previewData && (
             <div className="space-y-6">
+                {previewData.profile && (
+                    <div className="text-sm text-green-700 bg-green-50 p-2 rounded">
+                        Formato reconocido: se usó el mapeo guardado{previewData.profile.name ? ` (${previewData.profile.name})` : ''}.
+                    </div>
+                )}
                 <p className="text-sm text-gray-600">Confirma las columnas detectadas:</p>
 
                 <div className="grid grid-cols-2 gap-6">
@@ -233,6 +274,12 @@ const FileImportModal = ({ isOpen, onClose, accounts, onSuccess }) => {
                     </div>
                 </div>
 
+                {jobProgress && (
+                    <div className="text-sm text-blue-700 bg-blue-50 p-2 rounded">
+                        {jobProgress.status === 'PENDING' ? 'En cola...' : `Procesadas ${jobProgress.rows_processed} filas: ${jobProgress.imported} nuevas, ${jobProgress.duplicated} duplicadas, ${jobProgress.failed} con error`}
+                    </div>
+                )}
+
                 <div className="flex justify-end gap-2 pt-4">
                     <Button type="button" variant="ghost" onClick={() => setStep(1)}>&lt; Volver</Button>
                     <Button type="button" onClick={handleExecute} disabled={loading}>{loading ? 'Importando...' : 'Confirmar Importación'}</Button>